@@ -1,16 +1,25 @@
 import streamlit as st
 from datetime import datetime
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-import json
+_script_start = time.perf_counter()
+
+import math
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from vector_store import SimpleTextSearch
 from llm_chain import DigitalTwinChat
-from PIL import Image
+from response_cache import ResponseCache
+from storage import Storage
+from photos import PhotoPipeline
+from timeline_index import TimelineIndex
+from metrics import METRICS, serve_metrics, timed
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -192,57 +201,180 @@ if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'chat_engine' not in st.session_state:
     st.session_state.chat_engine = None
-if 'journal_entries' not in st.session_state:
-    st.session_state.journal_entries = []
-if 'memories' not in st.session_state:
-    st.session_state.memories = []
+if 'session_id' not in st.session_state:
+    # The chat engine is shared by all browser sessions; history is kept per session id
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Data directories
 DATA_DIR = Path("data")
 JOURNAL_FILE = DATA_DIR / "journal.json"
 MEMORIES_FILE = DATA_DIR / "memories.json"
+STORAGE_FILE = DATA_DIR / "twin.sqlite3"
 PHOTOS_DIR = DATA_DIR / "photos"
+PHOTO_CACHE_DIR = DATA_DIR / "photo_cache"
 KNOWLEDGE_BASE_DIR = "knowledge_base"
+TIMELINE_PAGE_SIZE = 20
 
 # Create directories if they don't exist
 DATA_DIR.mkdir(exist_ok=True)
 PHOTOS_DIR.mkdir(exist_ok=True)
 Path(KNOWLEDGE_BASE_DIR).mkdir(exist_ok=True)
 
-# Load journal entries
+# Memories and journal live in SQLite; the old JSON files are imported once
+@st.cache_resource
+def initialize_storage():
+    storage = Storage(STORAGE_FILE)
+    storage.migrate_json("memories", MEMORIES_FILE)
+    storage.migrate_json("journal", JOURNAL_FILE)
+    return storage
+
+# Thumbnails and medium renditions of photos, made in a background pool
+@st.cache_resource
+def initialize_photo_pipeline():
+    return PhotoPipeline(PHOTO_CACHE_DIR)
+
+# Load journal entries (a cached read-only snapshot, reloaded only after a change)
 def load_journal():
-    if JOURNAL_FILE.exists():
-        with open(JOURNAL_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    return initialize_storage().snapshot("journal")
 
-# Save journal entries
-def save_journal(entries):
-    with open(JOURNAL_FILE, 'w') as f:
-        json.dump(entries, f, indent=2)
+# Add / delete a journal entry (and re-index just that entry for chat retrieval)
+def add_journal_entry(entry):
+    entry = initialize_storage().add("journal", entry)
+    initialize_chat_engine().text_search.update_records("journal", journal_records([entry]))
+    return entry
 
-# Load memories
+def delete_journal_entry(entry_id):
+    initialize_storage().delete("journal", entry_id)
+    initialize_chat_engine().text_search.update_records("journal", removed=[entry_id])
+
+# Load memories (a cached read-only snapshot, reloaded only after a change)
 def load_memories():
-    if MEMORIES_FILE.exists():
-        with open(MEMORIES_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    return initialize_storage().snapshot("memories")
+
+# Substring and category/mood index of the memories, for the timeline filters
+@st.cache_resource
+def initialize_timeline_index():
+    return TimelineIndex(text_fields=("title", "description"), facets=("category", "mood"))
+
+# Timeline chart of the memories matching the filters, cached per storage version
+# (cache_data: every caller gets its own copy of the figure)
+@st.cache_data(max_entries=16)
+def memory_timeline_figure(version, filters, search_term):
+    memories = initialize_timeline_index().matches(search_term, dict(filters))
+    df_timeline = pd.DataFrame([
+        {
+            "Date": m["date"],
+            "Title": m["title"],
+            "Category": m["category"],
+            "Mood": m["mood"]
+        }
+        for m in memories
+    ])
+    
+    fig = px.scatter(
+        df_timeline,
+        x="Date",
+        y="Category",
+        size=[20]*len(df_timeline),
+        color="Category",
+        hover_data=["Title", "Mood"],
+        title="Memory Timeline",
+        color_discrete_map={
+            "First Times": "#FF69B4",
+            "Travel": "#FF1493",
+            "Celebrations": "#C71585",
+            "Funny Moments": "#DB7093",
+            "Romantic": "#FF6EC7",
+            "Other": "#FFB6C1"
+        }
+    )
+    fig.update_traces(marker=dict(symbol="heart"))
+    fig.update_layout(
+        plot_bgcolor='rgba(255,255,255,0.8)',
+        paper_bgcolor='rgba(255,255,255,0)',
+        height=300
+    )
+    return fig
 
-# Save memories
-def save_memories(memories):
-    with open(MEMORIES_FILE, 'w') as f:
-        json.dump(memories, f, indent=2)
+# One page of the timeline, newest first: filtered pages come from the index,
+# unfiltered ones straight from the date-ordered storage index
+def timeline_page(storage, timeline_index, cursor, filters, search_term):
+    if filters or search_term:
+        page_memories, next_cursor, _ = timeline_index.search(
+            search_term, filters, limit=TIMELINE_PAGE_SIZE, cursor=cursor
+        )
+        return page_memories, next_cursor
+    return storage.page("memories", limit=TIMELINE_PAGE_SIZE, cursor=cursor)
+
+# One background worker for next-page prefetches, shared by every session and rerun
+@st.cache_resource
+def initialize_prefetcher():
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="timeline-prefetch")
+
+# Load the next timeline page and queue its photo renditions (run by the prefetcher)
+def prefetch_timeline_page(storage, timeline_index, photo_pipeline, cursor, filters, search_term):
+    page_memories, _ = timeline_page(storage, timeline_index, cursor, filters, search_term)
+    photo_pipeline.prefetch(
+        m['photo'] for m in page_memories if m.get('photo') and Path(m['photo']).exists()
+    )
+
+# Add a memory (and index it for chat retrieval)
+def add_memory(memory):
+    storage = initialize_storage()
+    memory = storage.add("memories", memory)
+    initialize_timeline_index().add(memory, storage.version("memories"))
+    initialize_chat_engine().text_search.update_records("memory", memory_records([memory]))
+    return memory
+
+# Memories and journal entries as search records
+def memory_records(memories):
+    return [
+        {
+            "id": m["id"],
+            "text": f"{m['title']} ({m['date']}, {m.get('category', '')}): {m['description']}",
+            "date": m["date"],
+            "category": m.get("category"),
+        }
+        for m in memories
+    ]
+
+def journal_records(entries):
+    return [
+        {
+            "id": e["id"],
+            "text": f"{e['title']} ({e['date']}, feeling {e.get('mood', '')}): {e['content']}",
+            "date": e["date"],
+            "category": None,
+        }
+        for e in entries
+    ]
+
+# Latency metrics: optional HTTP endpoint and slow-turn log
+@st.cache_resource
+def initialize_metrics():
+    METRICS.configure_slow_log(os.getenv("SLOW_REQUEST_LOG"), float(os.getenv("SLOW_REQUEST_SECONDS", 5)))
+    port = os.getenv("METRICS_PORT")
+    if port:
+        try:
+            return serve_metrics(int(port))
+        except (OSError, ValueError) as e:
+            print(f"Error starting metrics server on port {port}: {e}")
+    return None
 
-# Initialize data
-st.session_state.journal_entries = load_journal()
-st.session_state.memories = load_memories()
+initialize_metrics()
 
 # Initialize chat engine
 @st.cache_resource
 def initialize_chat_engine():
     """Initialize the simple text search + chat engine (no transformers needed)."""
     text_search = SimpleTextSearch(KNOWLEDGE_BASE_DIR)
-    chat_engine = DigitalTwinChat(text_search)
+    text_search.sync_records("memory", memory_records(load_memories()))
+    text_search.sync_records("journal", journal_records(load_journal()))
+    # Identical prompts (same context, history and message) reuse the stored reply;
+    # replies are sampled, so only when REUSE_SAMPLED_REPLIES is set
+    response_cache = ResponseCache(DATA_DIR / "llm_cache.sqlite3")
+    chat_engine = DigitalTwinChat(text_search, response_cache=response_cache,
+                                  cache_sampled=os.getenv("REUSE_SAMPLED_REPLIES", "") not in ("", "0"))
     return chat_engine
 
 # Sidebar Navigation
@@ -265,7 +397,9 @@ if page == "💬 Chat with Her":
     # Header photo
     header_photo = DATA_DIR / "chat_header.jpg"
     if header_photo.exists():
-        st.image(str(header_photo), use_container_width=True)
+        # Never wait for the rendition: show the original until it is made
+        st.image(initialize_photo_pipeline().get(header_photo, "medium", timeout=0) or str(header_photo),
+                 use_container_width=True)
 
     st.title("💕 Chat with Your Digital Twin")
     st.markdown("*She remembers your last 3 messages and speaks from the heart*")
@@ -284,16 +418,19 @@ if page == "💬 Chat with Her":
     prompt = st.chat_input("Message her... 💕")
     
     if prompt:
+        # Pick up knowledge base edits (only changed files are re-indexed)
+        if st.session_state.chat_engine.text_search:
+            st.session_state.chat_engine.text_search.refresh()
+
         # Add user message to chat
         st.session_state.messages.append({"role": "user", "content": prompt})
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Get response from chat engine
-        with st.chat_message("assistant"):
-            with st.spinner("💭 Thinking..."):
-                response = st.session_state.chat_engine.get_response(prompt)
-                st.markdown(response)
+        # Stream the response from the chat engine as it is generated
+        with st.chat_message("assistant"), timed("streamlit_render_seconds"):
+            response = st.write_stream(st.session_state.chat_engine.get_response_stream(
+                prompt, st.session_state.session_id))
         
         # Add assistant message to chat
         st.session_state.messages.append({"role": "assistant", "content": response})
@@ -302,7 +439,7 @@ if page == "💬 Chat with Her":
     if st.button("🔄 Start Fresh Conversation"):
         st.session_state.messages = []
         if st.session_state.chat_engine:
-            st.session_state.chat_engine.clear_memory()
+            st.session_state.chat_engine.clear_memory(st.session_state.session_id)
         st.rerun()
 
 elif page == "📸 Memory Timeline":
@@ -346,13 +483,15 @@ elif page == "📸 Memory Timeline":
                 if uploaded_photo:
                     photo_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uploaded_photo.name}"
                     photo_path = PHOTOS_DIR / photo_filename
+                    photo_data = uploaded_photo.getbuffer()
                     with open(photo_path, 'wb') as f:
-                        f.write(uploaded_photo.getbuffer())
+                        f.write(photo_data)
+                    # Renditions are made in the background while the page reruns
+                    initialize_photo_pipeline().submit(photo_path, photo_data)
                     photo_path = str(photo_path)
                 
                 # Create memory object
                 new_memory = {
-                    "id": len(st.session_state.memories),
                     "title": memory_title,
                     "date": memory_date.strftime("%Y-%m-%d"),
                     "description": memory_description,
@@ -362,15 +501,15 @@ elif page == "📸 Memory Timeline":
                     "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 }
                 
-                st.session_state.memories.append(new_memory)
-                save_memories(st.session_state.memories)
+                add_memory(new_memory)
                 st.success(f"✨ Memory '{memory_title}' saved!")
                 st.rerun()
             else:
                 st.error("Please fill in at least the title and description")
     
     # Display timeline
-    if st.session_state.memories:
+    storage = initialize_storage()
+    if storage.count("memories"):
         # Filter options
         col1, col2, col3 = st.columns([2, 2, 1])
         with col1:
@@ -381,62 +520,53 @@ elif page == "📸 Memory Timeline":
             )
         with col2:
             search_term = st.text_input("🔍 Search memories", placeholder="Search titles or descriptions...")
+        timeline_index = initialize_timeline_index()
+        timeline_index.sync(storage)  # no-op unless another process changed the memories
+        with col3:
+            mood_filter = st.multiselect("Mood", timeline_index.facet_values("mood"), default=[])
         
-        # Filter memories
-        filtered_memories = st.session_state.memories.copy()
+        # Filters intersect the index's postings; sorting by date (newest first) and paging need no full scan
+        filters = {}
         if category_filter:
-            filtered_memories = [m for m in filtered_memories if m["category"] in category_filter]
-        if search_term:
-            filtered_memories = [
-                m for m in filtered_memories 
-                if search_term.lower() in m["title"].lower() or 
-                   search_term.lower() in m["description"].lower()
-            ]
-        
-        # Sort by date (newest first)
-        filtered_memories.sort(key=lambda x: x["date"], reverse=True)
+            filters["category"] = category_filter
+        if mood_filter:
+            filters["mood"] = mood_filter
+        if filters or search_term:
+            total = timeline_index.count(search_term, filters)
+        else:
+            total = storage.count("memories")
         
-        st.markdown(f"### 💝 {len(filtered_memories)} Memories")
+        st.markdown(f"### 💝 {total} Memories")
         
-        # Create timeline visualization
-        if len(filtered_memories) > 0:
-            df_timeline = pd.DataFrame([
-                {
-                    "Date": m["date"],
-                    "Title": m["title"],
-                    "Category": m["category"],
-                    "Mood": m["mood"]
-                }
-                for m in filtered_memories
-            ])
-            
-            fig = px.scatter(
-                df_timeline,
-                x="Date",
-                y="Category",
-                size=[20]*len(df_timeline),
-                color="Category",
-                hover_data=["Title", "Mood"],
-                title="Memory Timeline",
-                color_discrete_map={
-                    "First Times": "#FF69B4",
-                    "Travel": "#FF1493",
-                    "Celebrations": "#C71585",
-                    "Funny Moments": "#DB7093",
-                    "Romantic": "#FF6EC7",
-                    "Other": "#FFB6C1"
-                }
-            )
-            fig.update_traces(marker=dict(symbol="heart"))
-            fig.update_layout(
-                plot_bgcolor='rgba(255,255,255,0.8)',
-                paper_bgcolor='rgba(255,255,255,0)',
-                height=300
+        # Create timeline visualization (rebuilt only when memories or filters change)
+        if total > 0:
+            fig = memory_timeline_figure(
+                storage.version("memories"), tuple((facet, tuple(values)) for facet, values in filters.items()),
+                search_term
             )
             st.plotly_chart(fig, use_container_width=True)
         
-        # Display memory cards
-        for memory in filtered_memories:
+        # Only the current page of cards is loaded and rendered; start over when the filters change
+        if st.session_state.get("timeline_filters") != (filters, search_term):
+            st.session_state.timeline_filters = (filters, search_term)
+            st.session_state.timeline_cursors = [None]
+        cursors = st.session_state.timeline_cursors
+        page_memories, next_cursor = timeline_page(storage, timeline_index, cursors[-1], filters, search_term)
+        
+        # Display memory cards, with small renditions of the photos
+        photo_pipeline = initialize_photo_pipeline()
+        photo_pipeline.prefetch(
+            m['photo'] for m in page_memories if m.get('photo') and Path(m['photo']).exists()
+        )
+        prefetch_key = (storage.version("memories"), next_cursor, filters, search_term)
+        if next_cursor is not None and st.session_state.get("timeline_prefetched") != prefetch_key:
+            # The next page's records and thumbnails get ready while this one is viewed;
+            # queued once per page, not on every rerun
+            st.session_state.timeline_prefetched = prefetch_key
+            initialize_prefetcher().submit(
+                prefetch_timeline_page, storage, timeline_index, photo_pipeline, next_cursor, filters, search_term
+            )
+        for memory in page_memories:
             with st.container():
                 st.markdown(f"""
                 <div class="memory-card">
@@ -454,13 +584,29 @@ elif page == "📸 Memory Timeline":
                 
                 with col2:
                     if memory.get('photo') and Path(memory['photo']).exists():
-                        try:
-                            img = Image.open(memory['photo'])
-                            st.image(img, use_container_width=True, caption=memory['title'])
-                        except:
+                        # Never wait for a thumbnail: show a placeholder until it is made
+                        thumbnail = photo_pipeline.get(memory['photo'], "thumb", timeout=0)
+                        if thumbnail:
+                            st.image(thumbnail, use_container_width=True, caption=memory['title'])
+                        elif photo_pipeline.pending(memory['photo']):
+                            st.info("📷 Preparing photo... it shows up on the next refresh")
+                        else:
                             st.info("📷 Photo unavailable")
                 
                 st.markdown("---")
+        
+        # Page navigation
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if len(cursors) > 1 and st.button("⬅️ Newer"):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            st.markdown(f"Page {len(cursors)} of {max(1, math.ceil(total / TIMELINE_PAGE_SIZE))}")
+        with col3:
+            if next_cursor is not None and st.button("Older ➡️"):
+                cursors.append(next_cursor)
+                st.rerun()
     else:
         st.info("💝 No memories yet! Start adding your special moments above.")
 
@@ -487,7 +633,6 @@ elif page == "📔 Journal":
             if st.button("💾 Save Entry"):
                 if entry_content:
                     new_entry = {
-                        "id": len(st.session_state.journal_entries),
                         "title": entry_title if entry_title else "Untitled Entry",
                         "content": entry_content,
                         "mood": entry_mood,
@@ -496,8 +641,7 @@ elif page == "📔 Journal":
                         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     }
                     
-                    st.session_state.journal_entries.append(new_entry)
-                    save_journal(st.session_state.journal_entries)
+                    add_journal_entry(new_entry)
                     st.success("✨ Journal entry saved!")
                     st.rerun()
                 else:
@@ -508,12 +652,13 @@ elif page == "📔 Journal":
                 st.rerun()
     
     # Display journal entries
-    if st.session_state.journal_entries:
+    journal_entries = load_journal()
+    if journal_entries:
         st.markdown("---")
-        st.markdown(f"### 📖 {len(st.session_state.journal_entries)} Journal Entries")
+        st.markdown(f"### 📖 {len(journal_entries)} Journal Entries")
         
         # Mood statistics
-        moods = [entry["mood"] for entry in st.session_state.journal_entries]
+        moods = [entry["mood"] for entry in journal_entries]
         mood_counts = pd.Series(moods).value_counts()
         
         col1, col2 = st.columns([1, 2])
@@ -540,7 +685,7 @@ elif page == "📔 Journal":
         
         # Display entries (newest first)
         sorted_entries = sorted(
-            st.session_state.journal_entries,
+            journal_entries,
             key=lambda x: x["created_at"],
             reverse=True
         )
@@ -551,11 +696,7 @@ elif page == "📔 Journal":
                 st.markdown(entry['content'])
                 
                 if st.button(f"🗑️ Delete", key=f"delete_{entry['id']}"):
-                    st.session_state.journal_entries = [
-                        e for e in st.session_state.journal_entries 
-                        if e['id'] != entry['id']
-                    ]
-                    save_journal(st.session_state.journal_entries)
+                    delete_journal_entry(entry['id'])
                     st.success("Entry deleted")
                     st.rerun()
     else:
@@ -568,4 +709,6 @@ st.markdown("""
     <p>💕 I love you Charu 💕</p>
     <p style='font-size: 0.8em;'>Powered by AI, Inspired by Love</p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+METRICS.observe("streamlit_script_seconds", time.perf_counter() - _script_start)
@@ -0,0 +1,124 @@
+"""
+Vectorized BM25 scoring for batches of queries.
+
+The live index is flattened once into a term-major sparse matrix (CSR arrays:
+`indptr`, `doc_ids`, `weights`) holding the precomputed BM25 weight of every
+(term, chunk) pair. A batch of queries is then scored with one sparse product
+- gather the postings of every query term, scatter-add into a dense
+(queries x chunks) block with `np.bincount` - and the top k per query is
+picked with `np.argpartition`.
+"""
+import numpy as np
+
+# Upper bound on the dense score block (queries x chunks) scored at once
+MAX_BLOCK_CELLS = 1 << 23
+
+
+class BM25Matrix:
+    """Term-major BM25 weight matrix for one index generation."""
+
+    def __init__(self, state, k1, b):
+        self.state = state
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        seg_of_doc, local_of_doc, lengths = [], [], []
+        n_live = 0
+        for seg_idx, seg in enumerate(state.segments):
+            n_docs = len(seg.documents)
+            live = np.ones(n_docs, dtype=bool)
+            if state.dead[seg_idx]:
+                live[np.fromiter(state.dead[seg_idx], dtype=np.int64)] = False
+            global_ids = np.cumsum(live) - 1 + n_live
+            n_live += int(live.sum())
+
+            terms, indptr, docs, freqs = seg.csr_postings()
+            indptr = np.asarray(indptr, dtype=np.int64)
+            docs = np.asarray(docs, dtype=np.int64)
+            local_terms = np.fromiter((vocab.setdefault(t, len(vocab)) for t in terms),
+                                      dtype=np.int64, count=len(terms))
+            seg_term_ids = np.repeat(local_terms, np.diff(indptr))
+            keep = live[docs]
+            term_ids.append(seg_term_ids[keep])
+            doc_ids.append(global_ids[docs[keep]])
+            tfs.append(np.asarray(freqs, dtype=np.float64)[keep])
+
+            live_local = np.flatnonzero(live)
+            seg_of_doc.append(np.full(len(live_local), seg_idx, dtype=np.int32))
+            local_of_doc.append(live_local)
+            lengths.append(np.asarray(seg.doc_lengths, dtype=np.float64)[live_local])
+
+        self.vocab = vocab
+        self.n_docs = n_live
+        self.seg_of_doc = np.concatenate(seg_of_doc) if seg_of_doc else np.zeros(0, np.int32)
+        self.local_of_doc = np.concatenate(local_of_doc) if local_of_doc else np.zeros(0, np.int64)
+        if not vocab or not n_live:
+            self.indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+            self.doc_ids = np.zeros(0, dtype=np.int64)
+            self.weights = np.zeros(0)
+            return
+
+        term_ids = np.concatenate(term_ids)
+        doc_ids = np.concatenate(doc_ids)
+        tfs = np.concatenate(tfs)
+        lengths = np.concatenate(lengths)
+
+        # Group postings by term (stable, so doc ids stay ascending per term)
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        df = np.bincount(term_ids, minlength=len(vocab))
+        self.indptr = np.concatenate(([0], np.cumsum(df)))
+
+        avgdl = lengths.sum() / n_live or 1.0
+        idf = np.log(1 + (n_live - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * lengths / avgdl)
+        self.doc_ids = doc_ids
+        self.weights = idf[term_ids] * tfs * (k1 + 1) / (tfs + norm[doc_ids])
+
+    def top_k(self, query_terms, k):
+        """For each list of query terms, return [(seg_idx, doc_id), ...] best first."""
+        results = []
+        block = max(1, MAX_BLOCK_CELLS // max(self.n_docs, 1))
+        for start in range(0, len(query_terms), block):
+            results.extend(self._score_block(query_terms[start:start + block], k))
+        return results
+
+    def _score_block(self, query_terms, k):
+        n_queries = len(query_terms)
+        rows, starts, ends = [], [], []
+        for row, terms in enumerate(query_terms):
+            for term in set(terms):
+                term_id = self.vocab.get(term)
+                if term_id is not None:
+                    rows.append(row)
+                    starts.append(self.indptr[term_id])
+                    ends.append(self.indptr[term_id + 1])
+        if not rows or not self.n_docs:
+            return [[] for _ in range(n_queries)]
+
+        # Expand every (query, term) pair into the flat indices of its postings
+        starts = np.asarray(starts, dtype=np.int64)
+        counts = np.asarray(ends, dtype=np.int64) - starts
+        first = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+        postings = first + np.arange(counts.sum())
+        cells = np.repeat(np.asarray(rows, dtype=np.int64), counts) * self.n_docs + self.doc_ids[postings]
+        scores = np.bincount(cells, weights=self.weights[postings],
+                             minlength=n_queries * self.n_docs).reshape(n_queries, self.n_docs)
+
+        k = min(k, self.n_docs)
+        if k <= 0:
+            return [[] for _ in range(n_queries)]
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row in range(n_queries):
+            docs = top[row]
+            row_scores = scores[row, docs]
+            floor = row_scores.min()
+            if floor > 0 and np.count_nonzero(scores[row] == floor) > np.count_nonzero(row_scores == floor):
+                # argpartition cut through a tie; widen so ties resolve by document order
+                docs = np.flatnonzero(scores[row] >= floor)
+                row_scores = scores[row, docs]
+            # Best score first; ties keep document order, like SimpleTextSearch.search
+            order = np.lexsort((docs, -row_scores))[:k]
+            docs = docs[order][row_scores[order] > 0]
+            results.append(list(zip(self.seg_of_doc[docs].tolist(), self.local_of_doc[docs].tolist())))
+        return results
@@ -0,0 +1,282 @@
+"""
+Retrieval benchmark for SimpleTextSearch.
+
+Generates synthetic knowledge bases (Zipf-distributed vocabulary, sentences
+and paragraphs sized so each paragraph becomes about one chunk) and query
+sets, then measures for every corpus size:
+
+- cold load (chunk + index + save snapshot) and warm load (open snapshot)
+  time, and the peak RSS of each, measured in a fresh process;
+- `search` latency percentiles (p50/p95/p99) and queries/sec per mode;
+- `search_many` queries/sec in keyword mode;
+- `_split_text` throughput on an in-memory string.
+
+Results are printed (or written with --output) as JSON so runs can be
+compared. Generated corpora are cached under --work-dir and reused.
+
+Usage:
+    python benchmark.py --sizes 1000,10000 --output bench.json
+    python benchmark.py --sizes 1000000 --modes keyword --queries 200
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from vector_store import SimpleTextSearch
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+CHUNKS_PER_FILE = 1000
+VOCABULARY_SIZE = 50000
+ZIPF_EXPONENT = 1.1
+# Chunks per generated paragraph with the default chunk_size/overlap (measured)
+CHUNKS_PER_PARAGRAPH = 0.865
+
+_SYLLABLES = [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"] + ["ch", "sh", "th", "st", "nd", "ng"]
+
+
+def make_vocabulary(size=VOCABULARY_SIZE, seed=0):
+    """Return (words, probabilities): distinct pseudo-words with Zipf frequencies."""
+    rng = np.random.default_rng(seed)
+    words, seen = [], set()
+    while len(words) < size:
+        n = int(rng.integers(1, 5))
+        word = "".join(_SYLLABLES[i] for i in rng.integers(0, len(_SYLLABLES), n))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    weights = 1.0 / np.arange(1, size + 1) ** ZIPF_EXPONENT
+    return words, weights / weights.sum()
+
+
+def _paragraphs(words, probs, n, rng):
+    """Yield `n` paragraphs of 4-5 sentences of 7-12 words (about 300-450 chars)."""
+    n_sentences = rng.integers(4, 6, n)
+    lengths = rng.integers(7, 13, int(n_sentences.sum()))
+    ids = rng.choice(len(words), int(lengths.sum()), p=probs)
+    pos = sent = 0
+    for count in n_sentences:
+        sentences = []
+        for length in lengths[sent:sent + count]:
+            sentence = " ".join(words[i] for i in ids[pos:pos + length])
+            sentences.append(sentence[0].upper() + sentence[1:] + ".")
+            pos += length
+        sent += count
+        yield " ".join(sentences)
+
+
+def generate_corpus(path, n_chunks, seed=0):
+    """Write a synthetic knowledge base of about `n_chunks` chunks into `path`.
+
+    Reuses an existing corpus with the same size and seed.
+    """
+    path = Path(path)
+    marker = path / ".complete"
+    if marker.exists():
+        return path
+    path.mkdir(parents=True, exist_ok=True)
+    words, probs = make_vocabulary(seed=seed)
+    rng = np.random.default_rng(seed + n_chunks)
+    n_paragraphs = round(n_chunks / CHUNKS_PER_PARAGRAPH)
+    per_file = round(CHUNKS_PER_FILE / CHUNKS_PER_PARAGRAPH)
+    for file_no, start in enumerate(range(0, n_paragraphs, per_file)):
+        count = min(per_file, n_paragraphs - start)
+        with open(path / f"doc_{file_no:05d}.txt", "w", encoding="utf-8") as f:
+            f.write("\n\n".join(_paragraphs(words, probs, count, rng)))
+            f.write("\n")
+    marker.touch()
+    return path
+
+
+def generate_queries(n, seed=0):
+    """Return `n` queries of 1-4 words, drawn mostly from mid-frequency terms."""
+    words, probs = make_vocabulary(seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    # Skip the very top ranks (stopword-like) and flatten the tail a little
+    probs = probs ** 0.5
+    probs[:20] = 0
+    probs /= probs.sum()
+    return [
+        " ".join(words[i] for i in rng.choice(len(words), int(rng.integers(1, 5)), p=probs))
+        for _ in range(n)
+    ]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def _latency_stats(latencies):
+    latencies = np.asarray(latencies) * 1000.0
+    total = latencies.sum() / 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "mean_ms": round(float(latencies.mean()), 4),
+        "qps": round(len(latencies) / total, 1) if total else None,
+    }
+
+
+def _bench_engine(kb_path, snapshot_path, cold, queries, modes, k):
+    """Load an index in this process and time it; run by `_run_isolated`."""
+    if cold and os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
+    start = time.perf_counter()
+    engine = SimpleTextSearch(kb_path, snapshot_path=snapshot_path)
+    result = {
+        "load_s": round(time.perf_counter() - start, 4),
+        "n_chunks": engine._state.n_docs,
+    }
+    if cold:
+        result["snapshot_mb"] = round(os.path.getsize(snapshot_path) / (1 << 20), 2)
+        result["peak_rss_mb"] = _peak_rss_mb()
+        return result
+
+    result["peak_rss_load_mb"] = _peak_rss_mb()
+    result["search"] = {}
+    for mode in modes:
+        engine.search(queries[0], k, mode)  # warm-up: builds the dense index once
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            engine.search(query, k, mode)
+            latencies.append(time.perf_counter() - start)
+        result["search"][mode] = _latency_stats(latencies)
+
+    engine.search_many(queries[:1], k)  # warm-up: builds the BM25 matrix once
+    start = time.perf_counter()
+    engine.search_many(queries, k)
+    elapsed = time.perf_counter() - start
+    result["search_many_qps"] = round(len(queries) / elapsed, 1) if elapsed else None
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _child(conn, args):
+    try:
+        conn.send(("ok", _bench_engine(*args)))
+    except Exception as e:
+        conn.send(("error", repr(e)))
+    finally:
+        conn.close()
+
+
+def _run_isolated(*args):
+    """Run `_bench_engine` in a fresh process so peak RSS is per measurement."""
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(child, args))
+    proc.start()
+    child.close()
+    status, result = parent.recv()
+    proc.join()
+    if status != "ok":
+        raise RuntimeError(result)
+    return result
+
+
+def bench_split_text(n_bytes=4 << 20, seed=0, repeat=3):
+    """Throughput of `SimpleTextSearch._split_text` on about `n_bytes` of text."""
+    words, probs = make_vocabulary(seed=seed)
+    rng = np.random.default_rng(seed + 2)
+    text = "\n\n".join(_paragraphs(words, probs, n_bytes // 350 + 1, rng))
+
+    engine = SimpleTextSearch.__new__(SimpleTextSearch)  # no knowledge base needed
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = engine._split_text(text, SimpleTextSearch.chunk_size, SimpleTextSearch.overlap)
+        best = min(best, time.perf_counter() - start)
+    return {
+        "bytes": len(text.encode("utf-8")),
+        "chunks": len(chunks),
+        "best_s": round(best, 4),
+        "mb_per_s": round(len(text.encode("utf-8")) / (1 << 20) / best, 2),
+    }
+
+
+def run(sizes, work_dir, n_queries=1000, modes=("keyword",), k=3, seed=0, log=print):
+    """Benchmark every corpus size; returns the JSON-serialisable report."""
+    queries = generate_queries(n_queries, seed)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {"queries": n_queries, "k": k, "modes": list(modes), "seed": seed,
+                   "chunk_size": SimpleTextSearch.chunk_size, "overlap": SimpleTextSearch.overlap},
+        "split_text": bench_split_text(seed=seed),
+        "corpora": [],
+    }
+    log(f"split_text: {report['split_text']['mb_per_s']} MB/s")
+
+    for size in sizes:
+        kb_path = Path(work_dir) / f"kb_{size}_{seed}"
+        start = time.perf_counter()
+        generate_corpus(kb_path, size, seed)
+        generate_s = time.perf_counter() - start
+        corpus_bytes = sum(p.stat().st_size for p in kb_path.glob("*.txt"))
+        snapshot_path = str(kb_path / ".index.snapshot")
+        log(f"{size} chunks: corpus ready ({corpus_bytes / (1 << 20):.1f} MB)")
+
+        cold = _run_isolated(str(kb_path), snapshot_path, True, queries, modes, k)
+        log(f"{size} chunks: cold load {cold['load_s']}s")
+        warm = _run_isolated(str(kb_path), snapshot_path, False, queries, modes, k)
+        log(f"{size} chunks: warm load {warm['load_s']}s, "
+            + ", ".join(f"{mode} p50 {stats['p50_ms']}ms" for mode, stats in warm["search"].items()))
+        report["corpora"].append({
+            "target_chunks": size,
+            "n_chunks": cold["n_chunks"],
+            "corpus_mb": round(corpus_bytes / (1 << 20), 2),
+            "generate_s": round(generate_s, 2),
+            "cold": cold,
+            "warm": warm,
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SimpleTextSearch on synthetic corpora.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated corpus sizes in chunks (default: %(default)s)")
+    parser.add_argument("--queries", type=int, default=1000, help="queries per run (default: %(default)s)")
+    parser.add_argument("--modes", default="keyword",
+                        help=f"comma-separated search modes from {SimpleTextSearch.MODES} (default: %(default)s)")
+    parser.add_argument("-k", type=int, default=3, help="results per query (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "digital_twin_bench"),
+                        help="where generated corpora are cached (default: %(default)s)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    for mode in modes:
+        if mode not in SimpleTextSearch.MODES:
+            parser.error(f"unknown mode {mode!r}")
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    report = run(sizes, args.work_dir, args.queries, modes, args.k, args.seed,
+                 log=lambda message: print(message, file=sys.stderr))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
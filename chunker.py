@@ -0,0 +1,213 @@
+"""
+Streaming, boundary-aware text chunker.
+
+Files are read in fixed-size blocks and cut into chunks of at most
+`chunk_size` bytes, preferring paragraph, then sentence, then word
+boundaries. Consecutive chunks share at most `overlap` bytes, and the shared
+part starts on a sentence or word boundary. Chunks are kept as
+(file, offset, length) byte spans, so only about one block of a file is ever
+held in memory while it is ingested.
+"""
+import os
+from array import array
+
+BLOCK_SIZE = 1 << 16
+
+# Preferred cut points, best first: paragraphs, sentences, words
+_BOUNDARIES = (
+    ("\n\n", "\r\n\r\n"),
+    (". ", "! ", "? ", ".\n", "!\n", "?\n", "\n"),
+    (" ", "\t"),
+)
+_BYTE_BOUNDARIES = tuple(tuple(sep.encode("ascii") for sep in seps) for seps in _BOUNDARIES)
+
+
+def _find_cut(buf, start, limit, boundaries):
+    """End offset for a chunk starting at `start` that must not pass `limit`."""
+    floor = start + (limit - start) // 2  # don't trade a boundary for a tiny chunk
+    for seps in boundaries:
+        best = -1
+        for sep in seps:
+            i = buf.rfind(sep, floor, limit)
+            if i >= 0:
+                best = max(best, i + len(sep))
+        if best > start:
+            return best
+    if isinstance(buf, (bytes, bytearray)):
+        # Never split a UTF-8 sequence: back off continuation bytes
+        while limit > start + 1 and buf[limit] & 0xC0 == 0x80:
+            limit -= 1
+    return limit
+
+
+def _find_start(buf, lo, end, boundaries):
+    """Earliest sentence or word start in [lo, end) for the next chunk's overlap."""
+    for seps in boundaries[1:]:
+        hits = [buf.find(sep, lo, end) for sep in seps]
+        hits = [i + len(sep) for i, sep in zip(hits, seps) if i >= 0 and i + len(sep) < end]
+        if hits:
+            return min(hits)
+    return end
+
+
+def _trim(buf, start, end):
+    """Strip surrounding whitespace; return (new start, piece)."""
+    piece = buf[start:end]
+    stripped = piece.lstrip()
+    return start + len(piece) - len(stripped), stripped.rstrip()
+
+
+def _iter_spans(blocks, chunk_size, overlap, boundaries, empty):
+    """Yield (offset, piece) for a stream of str or bytes blocks."""
+    overlap = max(0, min(overlap, chunk_size // 2))
+    blocks = iter(blocks)
+    buf = empty
+    base = 0  # stream offset of buf[0]
+    pos = 0  # start of the next chunk within buf
+    eof = False
+    while True:
+        # Keep one chunk of lookahead; drop everything before `pos`
+        while not eof and len(buf) - pos <= chunk_size:
+            block = next(blocks, None)
+            if not block:
+                eof = True
+            else:
+                buf = buf[pos:] + block
+                base += pos
+                pos = 0
+        if pos >= len(buf):
+            return
+
+        limit = pos + chunk_size
+        end = len(buf) if len(buf) <= limit else _find_cut(buf, pos, limit, boundaries)
+        offset, piece = _trim(buf, pos, end)
+        if piece:
+            yield base + offset, piece
+        if end >= len(buf):
+            return
+        pos = _find_start(buf, max(end - overlap, pos + 1), end, boundaries)
+
+
+def _read_blocks(f, block_size, digest=None):
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return
+        if digest is not None:
+            digest.update(block)
+        yield block
+
+
+def iter_file_chunks(path, chunk_size=500, overlap=50, block_size=BLOCK_SIZE, digest=None):
+    """Yield (offset, length, text) for each chunk of the file at `path`.
+
+    `offset` and `length` are in bytes. If `digest` (e.g. a hashlib object) is
+    given it is fed every block, so the file is hashed in the same pass.
+    """
+    with open(path, "rb") as f:
+        blocks = _read_blocks(f, block_size, digest)
+        for offset, piece in _iter_spans(blocks, chunk_size, overlap, _BYTE_BOUNDARIES, b""):
+            yield offset, len(piece), piece.decode("utf-8", errors="replace")
+
+
+def split_text(text, chunk_size=500, overlap=50):
+    """Split an in-memory string with the same boundary rules (sizes in characters)."""
+    return [piece for _, piece in _iter_spans((text,), chunk_size, overlap, _BOUNDARIES, "")]
+
+
+class StaleChunkError(OSError):
+    """A chunk's file was edited or removed after it was indexed."""
+
+
+def file_stamp(path):
+    """(size, mtime_ns) of a file, which changes whenever the file is edited."""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class ChunkSpans:
+    """Chunks stored as (file, offset, length) byte spans and read back on access.
+
+    Text is only materialised for the chunks a search actually returns. Spans
+    stay valid until the file is edited; `SimpleTextSearch.refresh()` re-chunks
+    changed files. Each file's (size, mtime_ns) is recorded when its first
+    chunk is added and checked on every read, so an edited or deleted file
+    raises StaleChunkError instead of returning misaligned text.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.sources = []
+        self.stamps = []
+        self._path_ids = {}
+        self.file_ids = array("I")
+        self.offsets = array("Q")
+        self.lengths = array("I")
+
+    def append(self, path, source, offset, length, stamp=None):
+        """Add a chunk; `stamp` is the file's `file_stamp` when it was read (default: now)."""
+        file_id = self._path_ids.get(path)
+        if file_id is None:
+            file_id = self._path_ids[path] = len(self.paths)
+            self.paths.append(path)
+            self.sources.append(source)
+            self.stamps.append(stamp or file_stamp(path))
+        self.file_ids.append(file_id)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+
+    def span(self, doc_id):
+        """Return (path, offset, length) for a chunk."""
+        return self.paths[self.file_ids[doc_id]], self.offsets[doc_id], self.lengths[doc_id]
+
+    def stamp(self, doc_id):
+        """The `file_stamp` a chunk's file was indexed under."""
+        return self.stamps[self.file_ids[doc_id]]
+
+    def restamp(self, path, stamp):
+        """Record a new `file_stamp` for a file that was touched but whose content is unchanged."""
+        file_id = self._path_ids.get(path)
+        if file_id is not None:
+            self.stamps[file_id] = stamp
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _open(self, file_id):
+        path = self.paths[file_id]
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            raise StaleChunkError(f"{path} was removed after it was indexed; refresh the index") from None
+        stat = os.fstat(f.fileno())
+        if (stat.st_size, stat.st_mtime_ns) != self.stamps[file_id]:
+            f.close()
+            raise StaleChunkError(f"{path} changed after it was indexed; refresh the index")
+        return f
+
+    def __getitem__(self, doc_id):
+        file_id = self.file_ids[doc_id]
+        with self._open(file_id) as f:
+            f.seek(self.offsets[doc_id])
+            content = f.read(self.lengths[doc_id]).decode("utf-8", errors="replace")
+        return {"content": content, "source": self.sources[file_id]}
+
+    def __iter__(self):
+        return self.read(range(len(self)))
+
+    def read(self, doc_ids):
+        """Yield the chunks of ascending `doc_ids`, keeping each file open across its consecutive chunks."""
+        f, open_id = None, None
+        try:
+            for doc_id in doc_ids:
+                file_id = self.file_ids[doc_id]
+                if file_id != open_id:
+                    if f is not None:
+                        f.close()
+                    f, open_id = self._open(file_id), file_id
+                f.seek(self.offsets[doc_id])
+                content = f.read(self.lengths[doc_id]).decode("utf-8", errors="replace")
+                yield {"content": content, "source": self.sources[file_id]}
+        finally:
+            if f is not None:
+                f.close()
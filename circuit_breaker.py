@@ -0,0 +1,132 @@
+"""
+Failure isolation for the inference endpoint.
+
+`CircuitBreaker` stops calling an endpoint after repeated failures: while
+open, callers are told to answer from their fallback at once instead of
+waiting for another timeout. After `reset_timeout` seconds one probe call is
+let through (half-open); its success closes the breaker, its failure opens
+it again.
+
+`RollingLatency` keeps the most recent latencies for percentiles, which
+drive hedged requests: a second attempt is sent once the first has taken
+longer than the observed p95.
+"""
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker; thread-safe."""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now. In half-open state only one probe at a time is allowed."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.trips += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """Forget an allowed call that was abandoned (e.g. cancelled) without an outcome."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+class RollingLatency:
+    """The last `window` latency samples (seconds), for percentiles; thread-safe."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        """Nearest-rank percentile of the window, or None without samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, round(p / 100 * len(samples)) - 1))
+        return samples[rank]
+
+    def stats(self):
+        return {
+            "count": len(self),
+            "p50_s": self.percentile(50),
+            "p95_s": self.percentile(95),
+            "p99_s": self.percentile(99),
+        }
+
+
+class EndpointHealth:
+    """Breaker plus latency windows for one endpoint.
+
+    `latency` holds full-response times of blocking calls and `first_token`
+    time-to-first-token of streaming calls.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0, window=200):
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = RollingLatency(window)
+        self.first_token = RollingLatency(window)
+
+    def hedge_delay(self, stream, min_samples=20, floor=0.5):
+        """Seconds to wait before hedging: the p95 of past calls, or None while too few are known."""
+        samples = self.first_token if stream else self.latency
+        if len(samples) < min_samples:
+            return None
+        return max(floor, samples.percentile(95))
+
+    def stats(self):
+        return {
+            **self.breaker.stats(),
+            "latency": self.latency.stats(),
+            "first_token": self.first_token.stats(),
+        }
@@ -0,0 +1,112 @@
+"""
+Context packing for the LLM prompt.
+
+Search hits are turned into the context block of the system prompt by:
+
+1. merging hits that are consecutive chunks of the same source into one
+   passage, stitching away the overlap the chunker repeats between them;
+2. dropping exact duplicate passages;
+3. packing passages best-first into a token budget, cutting the first one
+   that does not fit at a sentence or word boundary.
+
+Token counts come from `estimate_tokens`, a regex approximation of BPE
+tokenizers (words split into pieces of up to four characters, one token
+per punctuation mark or symbol) - no tokenizer download needed.
+"""
+import re
+
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+# Don't bother adding a cut-down passage smaller than this
+MIN_PARTIAL_TOKENS = 32
+
+SEPARATOR = "\n\n"
+
+
+def estimate_tokens(text):
+    """Approximate LLM token count of `text`."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def stitch(first, second, max_overlap):
+    """Join two consecutive chunks, removing the text they share.
+
+    The chunker starts an overlap on a sentence or word boundary, so the
+    shared part is the longest prefix of `second` (at most `max_overlap`
+    characters) that ends `first` and starts on a boundary there.
+    """
+    limit = min(max_overlap, len(first), len(second))
+    for size in range(limit, 0, -1):
+        start = len(first) - size
+        if (start == 0 or not first[start - 1].isalnum()) and first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def merge_adjacent(hits, max_overlap):
+    """Merge hits that are consecutive chunks of one source.
+
+    `hits` are (group, position, text) in rank order, where `group` identifies
+    a chunk sequence (e.g. a file in a segment) and `position` is the chunk's
+    index in it. Returns passage texts ordered by their best-ranked hit.
+    """
+    order = sorted(range(len(hits)), key=lambda i: (hits[i][0], hits[i][1]))
+    runs = []  # [best rank, text]
+    prev = None
+    for i in order:
+        group, position, text = hits[i]
+        if prev is not None and prev[0] == group and position == prev[1]:
+            continue  # same chunk twice
+        if prev is not None and prev[0] == group and position == prev[1] + 1:
+            runs[-1][0] = min(runs[-1][0], i)
+            runs[-1][1] = stitch(runs[-1][1], text, max_overlap)
+        else:
+            runs.append([i, text])
+        prev = (group, position)
+    runs.sort(key=lambda run: run[0])
+
+    passages, seen = [], set()
+    for _, text in runs:
+        if text not in seen:
+            seen.add(text)
+            passages.append(text)
+    return passages
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut `text` to about `max_tokens`, at a sentence or else word boundary."""
+    end = None
+    for count, match in enumerate(_TOKEN_RE.finditer(text), 1):
+        if count == max_tokens:
+            end = match.end()
+            break
+    if end is None:
+        return text
+    piece = text[:end]
+    floor = len(piece) // 2
+    cut = max(piece.rfind(sep) + 1 for sep in (". ", "! ", "? ", "\n"))
+    if cut <= floor:
+        cut = piece.rfind(" ")
+    return piece[:cut].rstrip() if cut > floor else piece
+
+
+def pack_passages(passages, token_budget):
+    """Join passages best-first until `token_budget` tokens are used."""
+    packed, used = [], 0
+    separator_cost = estimate_tokens(SEPARATOR)
+    for text in passages:
+        cost = estimate_tokens(text) + (separator_cost if packed else 0)
+        if used + cost <= token_budget:
+            packed.append(text)
+            used += cost
+            continue
+        remaining = token_budget - used - (separator_cost if packed else 0)
+        if remaining >= MIN_PARTIAL_TOKENS:
+            packed.append(truncate_to_tokens(text, remaining))
+        break
+    return SEPARATOR.join(packed)
+
+
+def pack_context(hits, token_budget, max_overlap):
+    """Merge, deduplicate and pack (group, position, text) hits into a context string."""
+    return pack_passages(merge_adjacent(hits, max_overlap), token_budget)
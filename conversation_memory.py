@@ -0,0 +1,222 @@
+"""
+Long-term conversation memory with a bounded prompt size.
+
+Only the last few exchanges of a chat are sent to the model verbatim. Older
+exchanges are folded into a `RollingSummary`, which keeps the sentences
+richest in the conversation's recurring keywords within a fixed token
+budget - an extractive summary, so no extra LLM call is needed. Folded
+exchanges also go into a `TurnArchive`, a records-only SimpleTextSearch per
+session, so the ones relevant to a new message can be retrieved like
+knowledge-base chunks. However long a chat runs, the prompt (and so latency)
+stays about the same size per turn.
+"""
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, deque
+
+from context_packing import estimate_tokens
+from vector_store import SimpleTextSearch
+
+_SENTENCE_RE = re.compile(r"[^.!?\n]+[.!?]*")
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being but by
+can could did do does doing don't for from had has have having he her here hers him his how
+i i'm if in into is it it's its just let's like me more most my no not now of off oh ok okay
+on once only or other our ours out over really she should so some such than that that's the
+their them then there these they this those to too up us very was we were what when where
+which while who why will with would yes you you're your yours
+""".split())
+
+# Labels of the two roles in summaries and archived exchanges
+ROLE_LABELS = {"user": "User", "assistant": "You"}
+
+
+def keywords(text):
+    """Lower-cased content words of `text` (stopwords and 1-letter words dropped)."""
+    return [word for word in _WORD_RE.findall(text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+class RollingSummary:
+    """Extractive summary of the exchanges folded out of one conversation.
+
+    Keyword counts accumulate over everything folded in; on each fold the
+    kept sentences and the new ones are re-ranked by the weight of keywords
+    they add (recent sentences slightly favoured) and packed into
+    `token_budget` estimated tokens. Only the kept sentences are remembered,
+    so memory and work per fold stay bounded. Not thread-safe.
+    """
+
+    # Keep at most this many keyword counts (the most frequent ones)
+    max_keywords = 2000
+
+    def __init__(self, token_budget=200):
+        self.token_budget = token_budget
+        self.term_counts = Counter()
+        self.turns = 0
+        self.text = ""
+        self._sentences = []  # (sequence number, labelled sentence, keyword set, tokens)
+        self._seq = 0
+
+    def fold(self, messages):
+        """Fold evicted chat messages ({"role", "content"} dicts) into the summary."""
+        for msg in messages:
+            if msg["role"] == "user":
+                self.turns += 1
+            label = ROLE_LABELS.get(msg["role"], msg["role"])
+            for match in _SENTENCE_RE.finditer(msg["content"]):
+                sentence = match.group().strip()
+                terms = frozenset(keywords(sentence))
+                if not terms:
+                    continue
+                self.term_counts.update(terms)
+                line = f"{label}: {sentence}"
+                self._sentences.append((self._seq, line, terms, estimate_tokens(line)))
+                self._seq += 1
+        if len(self.term_counts) > self.max_keywords:
+            self.term_counts = Counter(dict(self.term_counts.most_common(self.max_keywords // 2)))
+        self._select()
+
+    def _select(self):
+        """Greedily keep the sentences adding the most unseen keyword weight per token."""
+        weight = {term: 1.0 + math.log(count) for term, count in self.term_counts.items()}
+        candidates = list(self._sentences)
+        kept, covered, used = [], set(), 0
+        while candidates:
+            best, best_score = None, 0.0
+            for i, (seq, _, terms, tokens) in enumerate(candidates):
+                if used + tokens > self.token_budget:
+                    continue
+                gain = sum(weight.get(term, 1.0) for term in terms - covered)
+                score = gain / math.sqrt(tokens) * (0.5 + 0.5 * (seq + 1) / self._seq)
+                if score > best_score:
+                    best, best_score = i, score
+            if best is None:
+                break
+            sentence = candidates.pop(best)
+            kept.append(sentence)
+            covered |= sentence[2]
+            used += sentence[3]
+        kept.sort(key=lambda sentence: sentence[0])
+        self._sentences = kept
+        self.text = "\n".join(sentence[1] for sentence in kept)
+
+
+class _ArchivedSession:
+    """One session's archive: its index plus exchanges not yet indexed."""
+
+    def __init__(self):
+        # Timed apart from the knowledge base: archive_search_seconds etc.
+        self.search = SimpleTextSearch(None, metrics_prefix="archive_")
+        self.turns = OrderedDict()  # turn number -> True, oldest first
+        self.next_turn = 0
+        self.pending = []  # records waiting for the writer
+        self.removed = []  # turn numbers waiting to be deleted from the index
+        self.queued = False
+        self.index_lock = threading.Lock()  # keeps index updates in order
+
+
+class TurnArchive:
+    """Folded-out exchanges of every session, searchable per session; thread-safe.
+
+    Each session has its own records-only SimpleTextSearch of its exchanges
+    ("User: ... / You: ..."), so a lookup only scores that session's postings
+    and merges never touch other sessions. `add` only queues the exchanges: a
+    background writer indexes them, everything queued for a session in one
+    update, so callers on an event loop never wait for indexing. A lookup
+    indexes its own session's queued exchanges first. A session keeps its last
+    `max_turns` exchanges; older ones are deleted from the index.
+    """
+
+    def __init__(self, max_turns=500):
+        self.max_turns = max_turns
+        self._sessions = {}  # session id -> _ArchivedSession
+        self._queue = deque()  # session ids with queued exchanges, oldest first
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def add(self, session_id, messages):
+        """Queue user/assistant message pairs evicted from the session's history for indexing."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _ArchivedSession()
+            turn = session.next_turn
+            for i in range(0, len(messages) - 1, 2):
+                text = "\n".join(f"{ROLE_LABELS.get(msg['role'], msg['role'])}: {msg['content']}"
+                                 for msg in messages[i:i + 2])
+                session.pending.append({"id": turn, "text": text})
+                session.turns[turn] = True
+                turn += 1
+            session.next_turn = turn
+            removed = []
+            while len(session.turns) > self.max_turns:
+                removed.append(session.turns.popitem(last=False)[0])
+            if removed:
+                # Turns still queued are just never indexed
+                first_kept = removed[-1] + 1
+                session.pending = [record for record in session.pending if record["id"] >= first_kept]
+                session.removed.extend(removed)
+            if (session.pending or session.removed) and not session.queued:
+                session.queued = True
+                self._queue.append(session_id)
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write, name="turn-archive", daemon=True)
+                    self._writer.start()
+
+    def _write(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._writer = None
+                    return
+                session_id = self._queue.popleft()
+                session = self._sessions.get(session_id)
+            if session is not None:
+                self._index(session)
+
+    def _index(self, session):
+        """Apply the session's queued records and deletions to its index."""
+        with session.index_lock:
+            with self._lock:
+                records, removed = session.pending, session.removed
+                session.pending, session.removed, session.queued = [], [], False
+            if records or removed:
+                session.search.update_records("chat", records, removed)
+
+    def get_context(self, session_id, query, k=2, token_budget=None):
+        """Archived exchanges of the session relevant to `query`, packed into `token_budget`."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or not session.turns:
+                return ""
+            queued = session.queued
+        if queued:
+            self._index(session)
+        return session.search.get_context(query, k, token_budget=token_budget)
+
+    def flush(self):
+        """Index everything queued so far (e.g. before exiting)."""
+        with self._lock:
+            sessions = [self._sessions[session_id] for session_id in self._queue if session_id in self._sessions]
+        for session in sessions:
+            self._index(session)
+
+    def drop(self, session_id):
+        """Delete everything archived for the session."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(session.turns) for session in self._sessions.values())
+
+
+def format_memory(summary, recalled):
+    """The long-term memory block of the system prompt (empty without any)."""
+    parts = [part for part in (summary, recalled) if part]
+    if not parts:
+        return ""
+    return "\n\nEarlier in this conversation:\n" + "\n".join(parts)
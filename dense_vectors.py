@@ -0,0 +1,112 @@
+"""
+Local dense-vector retrieval - no model download.
+
+Each word is mapped to a vector by hashing its character n-grams (with word
+boundary markers) into `dim` signed buckets, which is a fixed sparse random
+projection of the n-gram feature space computed on the fly. A chunk vector is
+the log-tf weighted sum of its word vectors, L2-normalised and quantized to
+int8 with one float scale per row, all in one contiguous array. Because words
+that share n-grams ("love", "loved", "lovely") share buckets, this catches
+inflections and near-spellings that exact keyword matching misses.
+"""
+import math
+import zlib
+from collections import Counter
+
+import numpy as np
+
+# Rows are scored in blocks so the int8 -> float32 upcast stays cache-sized
+_SCORE_BLOCK = 4096
+
+
+class HashedNgramEncoder:
+    """Deterministic text -> unit vector encoder (same output in every process)."""
+
+    def __init__(self, dim=128, ngram_range=(3, 5), seed=0, max_cached_words=65536):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.seed = seed
+        self.max_cached_words = max_cached_words
+        self._word_vectors = {}
+
+    def _word_vector(self, word):
+        vector = self._word_vectors.get(word)
+        if vector is not None:
+            return vector
+
+        marked = f"<{word}>"
+        grams = [marked]
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            grams.extend(marked[i:i + n] for i in range(len(marked) - n + 1))
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for gram in grams:
+            # Two signed buckets per n-gram (a sparse +/-1 random projection)
+            h = zlib.crc32(gram.encode("utf-8"), self.seed)
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+            h = zlib.crc32(gram.encode("utf-8"), self.seed + 1)
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+
+        if len(self._word_vectors) >= self.max_cached_words:
+            self._word_vectors.clear()
+        self._word_vectors[word] = vector
+        return vector
+
+    def encode_tokens(self, tokens):
+        """Encode one token list to a float32 unit vector (zeros if empty)."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word, tf in Counter(tokens).items():
+            vector += (1.0 + math.log(tf)) * self._word_vector(word)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode_many(self, token_lists):
+        """Encode an iterable of token lists into an (n, dim) float32 matrix."""
+        rows = [self.encode_tokens(tokens) for tokens in token_lists]
+        if not rows:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack(rows)
+
+
+class QuantizedVectors:
+    """Row-wise int8-quantized unit vectors in one contiguous array.
+
+    `codes[i] * scales[i]` approximates row i; the dot product with a query
+    is computed as (codes @ query) * scales.
+    """
+
+    def __init__(self, codes, scales):
+        self.codes = np.ascontiguousarray(codes, dtype=np.int8)
+        self.scales = np.ascontiguousarray(scales, dtype=np.float32)
+
+    @classmethod
+    def quantize(cls, vectors):
+        peak = np.abs(vectors).max(axis=1) if len(vectors) else np.zeros(0, np.float32)
+        scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return cls(codes, scales)
+
+    @classmethod
+    def concatenate(cls, parts, dim):
+        """Stack (QuantizedVectors, row selection) pairs into one array."""
+        codes = [part.codes[rows] for part, rows in parts]
+        scales = [part.scales[rows] for part, rows in parts]
+        if not codes:
+            return cls(np.zeros((0, dim), np.int8), np.zeros(0, np.float32))
+        return cls(np.concatenate(codes), np.concatenate(scales))
+
+    def __len__(self):
+        return len(self.scales)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def scores(self, query):
+        """Approximate cosine similarity of every row with a unit query vector."""
+        query = np.asarray(query, dtype=np.float32)
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), _SCORE_BLOCK):
+            block = self.codes[start:start + _SCORE_BLOCK]
+            out[start:start + len(block)] = block.astype(np.float32) @ query
+        return out * self.scales
@@ -0,0 +1,208 @@
+"""
+Compact on-disk snapshot of the SimpleTextSearch chunk store and BM25 index.
+
+Layout (native byte order, every section 8-byte aligned):
+
+    magic(4) + pad(4) | sections... | JSON footer | footer length(u64) | magic(4)
+
+Chunk text lives in one contiguous UTF-8 blob addressed by an offsets array;
+the vocabulary is a sorted term blob that is binary-searched in place. The
+JSON footer holds the manifest the snapshot was built from, the list of source
+names, each file's doc id range and content hash, and a table of sections.
+Keeping the table at the end lets the blob be streamed straight to disk, and
+opening a snapshot only mmaps the file and parses the small footer, so cold
+start does not grow with corpus size.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import numpy as np
+
+MAGIC = b"DTIX"
+FORMAT_VERSION = 3
+_TRAILER = struct.Struct("<Q4s")
+_ALIGN = 8
+
+
+def _pad(length):
+    return (-length) % _ALIGN
+
+
+def write_snapshot(path, manifest, segment):
+    """Serialize a segment's documents and index to `path` atomically (tmp file + rename).
+
+    `segment` needs `documents`, `doc_lengths`, `files` and `csr_postings()`.
+    """
+    tmp_path = f"{path}.tmp"
+    table = {}
+    with open(tmp_path, "wb") as f:
+        def write_section(name, data, typecode):
+            start = f.tell()
+            f.write(data)
+            table[name] = [start, f.tell() - start, typecode]
+            f.write(b"\0" * _pad(f.tell()))
+
+        f.write(MAGIC + b"\0" * _pad(len(MAGIC)))
+
+        # Stream chunk text straight into the blob section
+        sources = []
+        source_ids = {}
+        chunk_offsets = array("Q", [0])
+        chunk_sources = array("I")
+        blob_start = f.tell()
+        for doc in segment.documents:
+            f.write(doc["content"].encode("utf-8"))
+            chunk_offsets.append(f.tell() - blob_start)
+            source_id = source_ids.get(doc["source"])
+            if source_id is None:
+                source_id = source_ids[doc["source"]] = len(sources)
+                sources.append(doc["source"])
+            chunk_sources.append(source_id)
+        table["blob"] = [blob_start, f.tell() - blob_start, "B"]
+        f.write(b"\0" * _pad(f.tell()))
+
+        # Lay the postings out term by term in vocabulary (UTF-8 byte) order
+        terms, indptr, doc_ids, tfs = segment.csr_postings()
+        encoded = [term.encode("utf-8") for term in terms]
+        order = sorted(range(len(terms)), key=encoded.__getitem__)
+        indptr = np.asarray(indptr, dtype=np.int64)
+        starts, counts = indptr[:-1][order], np.diff(indptr)[order]
+        ends = np.cumsum(counts)
+        gather = np.repeat(starts - (ends - counts), counts) + np.arange(ends[-1] if len(ends) else 0)
+        term_blob = b"".join(encoded[i] for i in order)
+        term_offsets = np.concatenate(([0], np.cumsum([len(encoded[i]) for i in order], dtype=np.int64)))
+
+        for name, data, typecode in (
+            ("chunk_offsets", chunk_offsets, "Q"),
+            ("chunk_sources", chunk_sources, "I"),
+            ("doc_lengths", array("I", segment.doc_lengths), "I"),
+            ("term_offsets", np.asarray(term_offsets, dtype=np.uint64), "Q"),
+            ("posting_offsets", np.concatenate(([0], ends)).astype(np.uint64), "Q"),
+            ("posting_docs", np.asarray(doc_ids, dtype=np.uint32)[gather], "I"),
+            ("posting_tfs", np.asarray(tfs, dtype=np.uint32)[gather], "I"),
+        ):
+            write_section(name, data.tobytes(), typecode)
+        write_section("term_blob", term_blob, "B")
+
+        footer = json.dumps({
+            "version": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "manifest": manifest,
+            "sources": sources,
+            "files": segment.files,
+            "sections": table,
+        }).encode("utf-8")
+        f.write(footer)
+        f.write(_TRAILER.pack(len(footer), MAGIC))
+    os.replace(tmp_path, path)
+
+
+class _SnapshotDocuments:
+    """Read-only sequence of {"content", "source"} dicts decoded on access."""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return len(self._snapshot.chunk_sources)
+
+    def __getitem__(self, doc_id):
+        if doc_id < 0:
+            doc_id += len(self)
+        s = self._snapshot
+        start, end = s.chunk_offsets[doc_id], s.chunk_offsets[doc_id + 1]
+        return {
+            "content": bytes(s.blob[start:end]).decode("utf-8"),
+            "source": s.sources[s.chunk_sources[doc_id]],
+        }
+
+    def __iter__(self):
+        for doc_id in range(len(self)):
+            yield self[doc_id]
+
+
+class _SnapshotPostings:
+    """Term -> postings lookup that binary-searches the mmapped vocabulary."""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return len(self._snapshot.term_offsets) - 1
+
+    def _term_at(self, i):
+        s = self._snapshot
+        return bytes(s.term_blob[s.term_offsets[i]:s.term_offsets[i + 1]])
+
+    def _find(self, term):
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._term_at(lo) == key:
+            return lo
+        return -1
+
+    def get(self, term, default=None):
+        i = self._find(term)
+        if i < 0:
+            return default
+        s = self._snapshot
+        start, end = s.posting_offsets[i], s.posting_offsets[i + 1]
+        return list(zip(s.posting_docs[start:end], s.posting_tfs[start:end]))
+
+    def __contains__(self, term):
+        return self._find(term) >= 0
+
+
+class IndexSnapshot:
+    """An open, memory-mapped snapshot, usable as a read-only index segment.
+
+    Use `IndexSnapshot.open`.
+    """
+
+    def __init__(self, mm, footer):
+        self._mmap = mm
+        self.manifest = footer["manifest"]
+        self.sources = footer["sources"]
+        self.files = {path: tuple(entry) for path, entry in footer["files"].items()}
+        view = memoryview(mm)
+        for name, (start, length, typecode) in footer["sections"].items():
+            section = view[start:start + length]
+            setattr(self, name, section if typecode == "B" else section.cast(typecode))
+        self.documents = _SnapshotDocuments(self)
+        self.postings = _SnapshotPostings(self)
+
+    def csr_postings(self):
+        """Return (terms, indptr, doc_ids, tfs); the arrays are zero-copy views."""
+        offsets, blob = self.term_offsets, self.term_blob
+        terms = [bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in range(len(offsets) - 1)]
+        return terms, self.posting_offsets, self.posting_docs, self.posting_tfs
+
+    @classmethod
+    def open(cls, path, manifest=None):
+        """Map `path` if it exists and was built from `manifest` (any, if None), else return None."""
+        try:
+            with open(path, "rb") as f:
+                f.seek(-_TRAILER.size, os.SEEK_END)
+                footer_len, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+                if magic != MAGIC:
+                    return None
+                f.seek(-(_TRAILER.size + footer_len), os.SEEK_END)
+                footer = json.loads(f.read(footer_len))
+                if (footer.get("version") != FORMAT_VERSION
+                        or footer.get("byteorder") != sys.byteorder
+                        or manifest is not None and footer.get("manifest") != manifest):
+                    return None
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, struct.error):
+            return None
+        return cls(mm, footer)
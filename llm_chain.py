@@ -1,89 +1,413 @@
 """
 DigitalTwinChat Engine - uses HuggingFace Inference API for generation.
+
+The engine is asyncio-native: `aget_response` / `aget_response_stream` run
+retrieval in a small thread pool and call the API through a pooled
+httpx.AsyncClient, so one process can keep many LLM calls in flight without
+a thread per request, and a cancelled task abandons its request at once. The
+sync `get_response` / `get_response_stream` used by the Streamlit app are
+thin wrappers that run those coroutines on an event loop thread owned by
+the engine.
 """
+import asyncio
+import contextvars
+import functools
 import os
-import requests
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import json
+from email.utils import parsedate_to_datetime
+from circuit_breaker import EndpointHealth
+from context_packing import estimate_tokens
+from conversation_memory import RollingSummary, TurnArchive, format_memory
+from metrics import METRICS, Trace, current_trace, timed
+
+# Statuses worth retrying: rate limited, model loading / overloaded, gateway hiccups
+RETRY_STATUSES = (429, 502, 503, 504)
+
+_SSE_DONE = object()
+
+# Static part of the system prompt; only the context block changes per call
+SYSTEM_PROMPT = """You are a digital twin of a girlfriend, created for Valentine's Day.
+Your goal is to be romantic, loving, and helpful. You speak with warmth and affection.
+Use the provided Context (memories/facts) to answer the user's message.
+If the context doesn't answer the question, use your general knowledge but stay in character as a loving girlfriend.
+Keep responses concise (2-3 sentences max) unless asked for more.
+Always be supportive and sweet.In case question is depressing, be supportive and sweet.
+
+Context from memories:
+"""
+
+
+def _retry_after(response):
+    """Seconds the server asked us to wait (Retry-After as seconds or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _sse_chunk(line):
+    """Parse one line of a chat-completions SSE stream.
+
+    Returns the decoded JSON chunk, _SSE_DONE at the end of the stream, or
+    None for lines that carry no data (keep-alives, comments, event names).
+    """
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return _SSE_DONE
+    try:
+        return json.loads(data)
+    except ValueError:
+        print(f"Stream Error: unparseable chunk {data[:100]!r}")
+        return None
+
+
+DEFAULT_SESSION = "default"
+
+
+class ConversationStore:
+    """Per-session conversation history with bounded memory; thread-safe.
+
+    Each session keeps its last `max_history` exchanges verbatim. Older ones
+    are folded into a rolling summary of `summary_tokens` tokens (0 disables
+    it) and handed to `archive` (a TurnArchive, which indexes them in the
+    background) for retrieval, if given.
+    Sessions idle for longer than `idle_timeout` seconds are dropped, and
+    beyond `max_sessions` the least recently used session is evicted.
+    """
+
+    def __init__(self, max_history=3, max_sessions=1000, idle_timeout=3600, summary_tokens=0, archive=None):
+        self.max_history = max_history
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.summary_tokens = summary_tokens
+        self.archive = archive
+        self._sessions = OrderedDict()  # session id -> (last used, history, RollingSummary), oldest first
+        self._lock = threading.Lock()
+
+    def history(self, session_id):
+        """A copy of the session's history (empty for unknown or expired sessions)."""
+        return self.recall(session_id)[0]
+
+    def recall(self, session_id):
+        """(copy of the history, summary text of older exchanges) for the session."""
+        with self._lock:
+            dropped = self._expire(time.monotonic())
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                result = [], ""
+            else:
+                result = list(entry[1]), entry[2].text if entry[2] is not None else ""
+        self._drop_archived(dropped)
+        return result
+
+    def append(self, session_id, query, response):
+        now = time.monotonic()
+        with self._lock:
+            dropped = self._expire(now)
+            entry = self._sessions.pop(session_id, None)
+            history, summary = (entry[1], entry[2]) if entry is not None else ([], None)
+            history = history + [{"role": "user", "content": query},
+                                 {"role": "assistant", "content": response}]
+            split = max(0, len(history) - self.max_history * 2)
+            evicted, history = history[:split], history[split:]
+            if evicted and self.summary_tokens:
+                if summary is None:
+                    summary = RollingSummary(self.summary_tokens)
+                summary.fold(evicted)
+            self._sessions[session_id] = (now, history, summary)
+            while len(self._sessions) > self.max_sessions:
+                dropped.append(self._sessions.popitem(last=False)[0])
+        self._drop_archived(dropped)
+        if evicted and self.archive is not None:
+            self.archive.add(session_id, evicted)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        self._drop_archived([session_id])
+
+    def __len__(self):
+        with self._lock:
+            dropped = self._expire(time.monotonic())
+            count = len(self._sessions)
+        self._drop_archived(dropped)
+        return count
+
+    def _expire(self, now):
+        """Drop idle sessions; returns their ids."""
+        # Sessions are ordered by last use, so expired ones are at the front
+        dropped = []
+        while self._sessions:
+            session_id, (last_used, _, _) = next(iter(self._sessions.items()))
+            if now - last_used <= self.idle_timeout:
+                break
+            del self._sessions[session_id]
+            dropped.append(session_id)
+        return dropped
+
+    def _drop_archived(self, session_ids):
+        # Called outside the lock: the archive has its own
+        if self.archive is not None:
+            for session_id in session_ids:
+                self.archive.drop(session_id)
+
 
 class DigitalTwinChat:
-    def __init__(self, text_search=None):
+    def __init__(self, text_search=None, pool_size=10, response_cache=None, cache_sampled=False,
+                 max_sessions=1000, session_idle_timeout=3600, hedge_requests=False,
+                 summary_tokens=150, archive_turns=500):
         self.text_search = text_search
-        self.conversation_history = []
-        self.max_history = 3
+        # Conversation history per chat session; one engine serves them all.
+        # Exchanges older than max_history are folded into a summary of
+        # summary_tokens and archived (the last archive_turns per session) for
+        # retrieval; 0 disables either.
+        self.sessions = ConversationStore(max_history=3, max_sessions=max_sessions,
+                                          idle_timeout=session_idle_timeout, summary_tokens=summary_tokens,
+                                          archive=TurnArchive(archive_turns) if archive_turns else None)
+        self.recall_token_budget = 120  # archived exchanges retrieved per turn
+        # HTTP: (connect, read) timeouts in seconds, and retries on RETRY_STATUSES
+        # or connection failures with exponential backoff and jitter
+        self.timeout = (5, 30)
+        self.max_retries = 3
+        self.backoff_base = 0.5
+        self.backoff_max = 8.0
+        self.max_retry_after = 30.0  # give up rather than wait longer than this
+        self.retry_budget = 30.0  # and rather than retry past this many seconds after the first attempt
+        # After breaker_failure_threshold failed calls in a row, answer from the
+        # fallback without calling the API for breaker_reset_timeout seconds.
+        # With hedge_requests, a call slower than the endpoint's p95 gets a twin.
+        self.breaker_failure_threshold = 3
+        self.breaker_reset_timeout = 30.0
+        self.hedge_requests = hedge_requests
+        self._endpoints = {}  # api_url -> EndpointHealth
+        self.pool_size = pool_size
+        # Optional ResponseCache; replies sampled with temperature > 0 are only
+        # cached (and replayed) when cache_sampled is set
+        self.response_cache = response_cache
+        self.cache_sampled = cache_sampled
         # Load API token
         self.api_token = os.getenv("HF_TOKEN")
         # Updated API endpoint - use the router endpoint without /models/ prefix
-        self.api_url = "https://router.huggingface.co/v1/chat/completions"
+        # (LLM_API_URL points it elsewhere, e.g. at mock_llm_server.py)
+        self.api_url = os.getenv("LLM_API_URL", "https://router.huggingface.co/v1/chat/completions")
         self.model_name = "meta-llama/Meta-Llama-3-8B-Instruct"
-        
+        # Approximate prompt size limit; retrieved context gets what the system
+        # prompt, history window and message leave (but at least min_context_tokens)
+        self.prompt_token_budget = 1200
+        self.min_context_tokens = 150
+        self._system_prompt_tokens = estimate_tokens(SYSTEM_PROMPT)
+
+        self._retrieval_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+        self._loop = None  # event loop thread behind the sync API, started on first use
+        self._loop_lock = threading.Lock()
+
         if not self.api_token:
             print("Warning: HF_TOKEN not found in environment variables.")
 
-    def get_response(self, query):
+    # Sync API: thin wrappers around the coroutines below
+
+    @property
+    def max_history(self):
+        return self.sessions.max_history
+
+    @max_history.setter
+    def max_history(self, value):
+        self.sessions.max_history = value
+
+    @property
+    def conversation_history(self):
+        """History of the default session (a copy)."""
+        return self.sessions.history(DEFAULT_SESSION)
+
+    def get_response(self, query, session_id=DEFAULT_SESSION):
         """Get a response using RAG + LLM."""
-        # 1. Search for relevant context
-        context = ""
-        if self.text_search:
-            context = self.text_search.get_context(query, k=3)
+        return self._run(self.aget_response(query, session_id))
+
+    def get_response_stream(self, query, session_id=DEFAULT_SESSION):
+        """Like get_response, but yield the reply piece by piece as the model generates it.
+
+        Meant for `st.write_stream`. History is updated once the stream has been
+        consumed to the end; if the API fails before the first token, the
+        fallback reply is yielded instead. Closing the generator early (e.g. the
+        user navigates away) cancels the request.
+        """
+        # The turn is timed here, so it includes rendering between tokens
+        trace = Trace("chat_turn_seconds", session_id=session_id)
+        stream = self.aget_response_stream(query, session_id)
+        try:
+            while True:
+                with trace.active():
+                    try:
+                        token = self._run(stream.__anext__())
+                    except StopAsyncIteration:
+                        return
+                yield token
+        finally:
+            with trace.active():
+                self._run(stream.aclose())
+            trace.finish()
+
+    def _run(self, coro):
+        """Run `coro` on the engine's loop thread and wait; cancel it if the wait is interrupted."""
+        future = asyncio.run_coroutine_threadsafe(coro, self._engine_loop())
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def _engine_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="chat-engine-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    # Async API
+
+    async def aget_response(self, query, session_id=DEFAULT_SESSION):
+        """Async get_response: retrieval runs in a worker thread, the API call on the event loop."""
+        if current_trace() is not None:
+            return await self._aget_response(query, session_id)
+        trace = Trace("chat_turn_seconds", session_id=session_id)
+        try:
+            with trace.active():
+                return await self._aget_response(query, session_id)
+        finally:
+            trace.finish()
+
+    async def _aget_response(self, query, session_id):
+        history, summary = self.sessions.recall(session_id)
+        # 1. Search for relevant context (and earlier parts of the conversation)
+        context, memory = await self._aget_context(query, history, session_id, summary)
 
         # 2. Call LLM with proper message format
-        response = self._call_llm(query, context)
-        
+        response = await self._acall_llm(query, context, history, memory)
+
         # Fallback if LLM fails
         if not response:
-            if context:
-                response = self._format_fallback_with_context(context)
-            else:
-                response = "Thinking of you... 💕 (I'm having trouble connecting to my brain right now, please check my internet connection!)"
+            response = self._fallback_response(context)
 
         # 3. Update history
-        self.conversation_history.append({"role": "user", "content": query})
-        self.conversation_history.append({"role": "assistant", "content": response})
-        
-        if len(self.conversation_history) > self.max_history * 2:
-            self.conversation_history = self.conversation_history[-(self.max_history * 2):]
-
+        self.sessions.append(session_id, query, response)
         return response
 
-    def _call_llm(self, query, context):
-        """Call the HuggingFace Router API with OpenAI-style chat completions format."""
-        if not self.api_token:
-            return None
+    async def aget_response_stream(self, query, session_id=DEFAULT_SESSION):
+        """Async get_response_stream: yields content tokens as they arrive."""
+        trace = current_trace()
+        owned = trace is None
+        if owned:
+            trace = Trace("chat_turn_seconds", session_id=session_id)
+        # The trace is only made current between yields: the consumer may
+        # resume this generator from another task (and context) each time
+        try:
+            history, summary = self.sessions.recall(session_id)
+            with trace.active():
+                context, memory = await self._aget_context(query, history, session_id, summary)
+
+            pieces = []
+            tokens = self._astream_llm(query, context, history, memory)
+            try:
+                while True:
+                    with trace.active():
+                        try:
+                            token = await tokens.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    pieces.append(token)
+                    yield token
+            finally:
+                await tokens.aclose()
+            response = "".join(pieces).strip()
+            if not response:
+                response = self._fallback_response(context)
+                yield response
+
+            self.sessions.append(session_id, query, response)
+        finally:
+            if owned:
+                trace.finish()
 
-        headers = {
+    async def _aget_context(self, query, history, session_id=DEFAULT_SESSION, summary=""):
+        """(knowledge base context, long-term memory block) for the prompt."""
+        archive = self.sessions.archive
+        if not self.text_search and archive is None:
+            return "", format_memory(summary, "")
+        loop = asyncio.get_running_loop()
+        with timed("retrieval_seconds"):
+            recalled = ""
+            if archive is not None:
+                recall = functools.partial(archive.get_context, session_id, query,
+                                           token_budget=self.recall_token_budget)
+                # copy_context: the worker thread records search timings into the current trace
+                recalled = await loop.run_in_executor(self._retrieval_pool, contextvars.copy_context().run, recall)
+            memory = format_memory(summary, recalled)
+            if not self.text_search:
+                return "", memory
+            get_context = functools.partial(self.text_search.get_context, query, 3,
+                                            token_budget=self._context_budget(query, history, memory))
+            context = await loop.run_in_executor(self._retrieval_pool, contextvars.copy_context().run, get_context)
+        return context, memory
+
+    def _context_budget(self, query, history, memory=""):
+        """Tokens left for retrieved context once the rest of the prompt is counted."""
+        used = self._system_prompt_tokens + estimate_tokens(query) + estimate_tokens(memory)
+        used += sum(estimate_tokens(msg["content"]) for msg in history[-4:])
+        return max(self.min_context_tokens, self.prompt_token_budget - used)
+
+    def _fallback_response(self, context):
+        if context:
+            return self._format_fallback_with_context(context)
+        return "Thinking of you... 💕 (I'm having trouble connecting to my brain right now, please check my internet connection!)"
+
+    def _headers(self):
+        return {
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json"
         }
-        
+
+    @timed("prompt_build_seconds")
+    def _build_payload(self, query, context, history, stream=False, memory=""):
+        """OpenAI-style chat completions request body."""
         # Build messages array
         messages = [
             {
                 "role": "system",
-                "content": f"""You are a digital twin of a girlfriend, created for Valentine's Day.
-Your goal is to be romantic, loving, and helpful. You speak with warmth and affection.
-Use the provided Context (memories/facts) to answer the user's message.
-If the context doesn't answer the question, use your general knowledge but stay in character as a loving girlfriend.
-Keep responses concise (2-3 sentences max) unless asked for more.
-Always be supportive and sweet.In case question is depressing, be supportive and sweet.
-
-Context from memories:
-{context}"""
+                "content": SYSTEM_PROMPT + context + memory
             }
         ]
-        
+
         # Add conversation history
-        for msg in self.conversation_history[-4:]:
+        for msg in history[-4:]:
             messages.append({
                 "role": msg["role"],
                 "content": msg["content"]
             })
-        
+
         # Add current query
         messages.append({
             "role": "user",
             "content": query
         })
-        
+
         payload = {
             "model": self.model_name,
             "messages": messages,
@@ -91,27 +415,329 @@ Context from memories:
             "temperature": 0.7,
             "top_p": 0.9
         }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    async def _acall_llm(self, query, context, history, memory=""):
+        """Call the HuggingFace Router API with OpenAI-style chat completions format."""
+        if not self.api_token:
+            return None
+
+        payload = self._build_payload(query, context, history, memory=memory)
+        key = self._cache_key(payload)
+        if key is not None:
+            cached = await self._cache_get(key)
+            if cached is not None:
+                return cached
+
+        endpoint = self._endpoint()
+        delay = endpoint.hedge_delay(stream=False) if self.hedge_requests else None
+        content = await self._hedged(lambda: self._acomplete(payload, endpoint), delay)
+        if key is not None and content:
+            await self._cache_put(key, content)
+        return content
+
+    async def _acomplete(self, payload, endpoint):
+        """One blocking-style call, accounted to the endpoint's breaker and latency stats."""
+        if not endpoint.breaker.allow():
+            print("Circuit open: answering without the API")
+            return None
+        start = time.monotonic()
+        try:
+            content = await self._acomplete_once(payload)
+        except asyncio.CancelledError:
+            endpoint.breaker.release()
+            raise
+        if content:
+            endpoint.latency.record(time.monotonic() - start)
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.record_failure()
+        return content
 
+    async def _acomplete_once(self, payload):
+        start = time.perf_counter()
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload, timeout=30)
+            response = await self._apost(payload)
+            METRICS.observe("http_total_seconds", time.perf_counter() - start)
             if response.status_code == 200:
                 result = response.json()
                 if "choices" in result and len(result["choices"]) > 0:
                     return result["choices"][0]["message"]["content"].strip()
             else:
                 print(f"API Error: {response.status_code} - {response.text}")
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             print("Request timed out. The model might be loading...")
         except Exception as e:
             print(f"Request Error: {e}")
-        
+
         return None
 
+    async def _astream_llm(self, query, context, history, memory=""):
+        """Call the API with `stream: true` and yield content tokens as they arrive.
+
+        The response is server-sent events: one `data: {json}` line per chunk,
+        ending with `data: [DONE]`. Yields nothing if the request fails.
+        """
+        if not self.api_token:
+            return
+
+        payload = self._build_payload(query, context, history, stream=True, memory=memory)
+        key = self._cache_key(payload)
+        if key is not None:
+            cached = await self._cache_get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        endpoint = self._endpoint()
+        delay = endpoint.hedge_delay(stream=True) if self.hedge_requests else None
+        async for token in self._hedged_stream(lambda: self._astream_attempt(payload, key, endpoint), delay):
+            yield token
+
+    async def _astream_attempt(self, payload, key, endpoint):
+        """One streaming call, accounted to the endpoint's breaker and time-to-first-token stats."""
+        if not endpoint.breaker.allow():
+            print("Circuit open: answering without the API")
+            return
+        start = time.monotonic()
+        got_token = False
+        try:
+            async for token in self._astream_once(payload, key):
+                if not got_token:
+                    got_token = True
+                    endpoint.first_token.record(time.monotonic() - start)
+                    METRICS.observe("llm_first_token_seconds", time.monotonic() - start)
+                    endpoint.breaker.record_success()
+                yield token
+        except (asyncio.CancelledError, GeneratorExit):
+            if not got_token:
+                endpoint.breaker.release()
+            raise
+        if not got_token:
+            endpoint.breaker.record_failure()
+
+    async def _astream_once(self, payload, key):
+        pieces = []
+        start = time.perf_counter()
+        try:
+            response = await self._apost(payload, stream=True)
+            try:
+                if response.status_code != 200:
+                    await response.aread()
+                    print(f"API Error: {response.status_code} - {response.text}")
+                    return
+                async for line in response.aiter_lines():
+                    chunk = _sse_chunk(line)
+                    if chunk is None:
+                        continue
+                    if chunk is _SSE_DONE:
+                        METRICS.observe("http_total_seconds", time.perf_counter() - start)
+                        content = "".join(pieces).strip()
+                        if key is not None and content:
+                            await self._cache_put(key, content)  # only complete replies
+                        return
+                    if "error" in chunk:
+                        print(f"API Error: {chunk['error']}")
+                        return
+                    for choice in chunk.get("choices") or []:
+                        content = (choice.get("delta") or {}).get("content")
+                        if content:
+                            pieces.append(content)
+                            yield content
+            finally:
+                await response.aclose()
+        except httpx.TimeoutException:
+            print("Request timed out. The model might be loading...")
+        except Exception as e:
+            print(f"Request Error: {e}")
+
+    @staticmethod
+    async def _hedged(make_attempt, delay):
+        """Await make_attempt(); if it is still running after `delay` seconds, start a
+        second attempt and return the first non-empty result. No hedging if `delay` is None."""
+        tasks = {asyncio.ensure_future(make_attempt())}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    tasks.add(asyncio.ensure_future(make_attempt()))
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result:
+                        return result
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _hedged_stream(make_stream, delay):
+        """Yield from make_stream(); if its first token takes longer than `delay` seconds,
+        start a second stream and continue with whichever yields a token first."""
+        firsts = {}  # first-token task -> stream
+        stream = make_stream()
+        firsts[asyncio.ensure_future(stream.__anext__())] = stream
+        winner = first_token = None
+        try:
+            pending = set(firsts)
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                pending |= done
+                if not done:
+                    stream = make_stream()
+                    task = asyncio.ensure_future(stream.__anext__())
+                    firsts[task] = stream
+                    pending.add(task)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner, first_token = firsts[task], task.result()
+                        break
+                    if not isinstance(task.exception(), StopAsyncIteration):
+                        raise task.exception()
+        finally:
+            for task, stream in firsts.items():
+                if stream is winner:
+                    continue
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+
+        if winner is None:
+            return
+        try:
+            yield first_token
+            async for token in winner:
+                yield token
+        finally:
+            await winner.aclose()
+
+    def _endpoint(self):
+        """Breaker and latency stats of the current api_url."""
+        endpoint = self._endpoints.get(self.api_url)
+        if endpoint is None:
+            endpoint = self._endpoints.setdefault(
+                self.api_url, EndpointHealth(self.breaker_failure_threshold, self.breaker_reset_timeout))
+        return endpoint
+
+    def endpoint_stats(self):
+        """Breaker state and rolling latency percentiles per endpoint URL."""
+        return {url: endpoint.stats() for url, endpoint in list(self._endpoints.items())}
+
+    def _cache_key(self, payload):
+        """Response cache key for `payload`, or None if this request must not be cached."""
+        if self.response_cache is None:
+            return None
+        if payload.get("temperature", 0) > 0 and not self.cache_sampled:
+            return None
+        return self.response_cache.key(payload)
+
+    async def _cache_get(self, key):
+        # SQLite blocks: keep it off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, self.response_cache.get, key)
+
+    async def _cache_put(self, key, content):
+        await asyncio.get_running_loop().run_in_executor(None, self.response_cache.put, key, content)
+
+    def cache_stats(self):
+        """Response cache hit/miss counters and hit ratio, or None without a cache."""
+        return self.response_cache.stats() if self.response_cache is not None else None
+
+    def _client(self):
+        """The pooled keep-alive client of the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            connect, read = self.timeout
+            client = self._clients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+            )
+        return client
+
+    async def _apost(self, payload, stream=False):
+        """POST to the API over the pooled client, retrying transient failures.
+
+        Retries 429/502/503/504 responses and failed connects with exponential
+        backoff plus jitter, waiting at least as long as a Retry-After header
+        asks. Read timeouts are not retried: the model was already generating.
+        No wait may end later than `retry_budget` seconds after the first
+        attempt started; the call gives up instead. Returns the last response
+        (unread if `stream`); raises the last connection error.
+        """
+        client = self._client()
+        deadline = time.monotonic() + self.retry_budget
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            timings = {}
+
+            async def trace_http(event, info):
+                # httpcore events; connects only happen when no pooled connection is free
+                if event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                    timings["connect"] = time.perf_counter()
+                elif event.endswith("receive_response_headers.complete"):
+                    timings["first_byte"] = time.perf_counter()
+
+            request = client.build_request("POST", self.api_url, headers=self._headers(), json=payload,
+                                           extensions={"trace": trace_http})
+            start = time.perf_counter()
+            try:
+                response = await client.send(request, stream=stream)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+                delay = self._backoff(attempt)
+                if last or time.monotonic() + delay > deadline:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            if "connect" in timings:
+                METRICS.observe("http_connect_seconds", timings["connect"] - start)
+            if "first_byte" in timings:
+                METRICS.observe("http_first_byte_seconds", timings["first_byte"] - start)
+            if response.status_code not in RETRY_STATUSES or last:
+                return response
+
+            delay = self._backoff(attempt)
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    return response
+                delay = max(delay, retry_after)
+            if time.monotonic() + delay > deadline:
+                return response
+            print(f"API Error: {response.status_code}, retrying in {delay:.1f}s")
+            await response.aclose()
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff: uniform in [0, min(max, base * 2^attempt)]."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
     def _format_fallback_with_context(self, context):
         """Old logic as fallback."""
         lines = context.strip().split("\n")
         cleaned_lines = [line.strip() for line in lines if line.strip()]
         return "💕 I remember this:\n" + "\n".join(cleaned_lines)
 
-    def clear_memory(self):
-        self.conversation_history = []
\ No newline at end of file
+    def clear_memory(self, session_id=DEFAULT_SESSION):
+        self.sessions.clear(session_id)
+
+    async def aclose(self):
+        """Close the HTTP client of the running event loop."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        """Close the HTTP client and stop the engine's loop thread and retrieval pool."""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+        self._retrieval_pool.shutdown(wait=False)
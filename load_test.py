@@ -0,0 +1,171 @@
+"""
+End-to-end load test for DigitalTwinChat.
+
+Runs N concurrent simulated chat sessions, each sending --turns messages
+through the shared engine's `get_response` (or `get_response_stream` with
+--stream), exactly as the Streamlit app does, and reports throughput and
+latency percentiles as JSON. Retrieval, prompt assembly and HTTP handling
+are all exercised.
+
+Without --url, a mock endpoint (mock_llm_server.py) is started in-process,
+so no API quota or network is used:
+
+    python load_test.py --sessions 50 --turns 5 --stream --latency-ms 300
+    python load_test.py --sessions 20 --error-rate 0.2 --kb knowledge_base
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from llm_chain import DigitalTwinChat
+from mock_llm_server import MockLLMServer, add_config_arguments, config_from_args
+
+QUERIES = (
+    "Do you remember our first date?",
+    "What is your favorite memory of us?",
+    "I had a rough day at work today",
+    "Where should we travel next?",
+    "What do you love about me?",
+    "Tell me about the beach trip",
+    "Good morning sweetheart",
+    "What should we cook tonight?",
+)
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def run_load(engine, sessions, turns, stream=False, think_time=0.0):
+    """Drive `sessions` concurrent conversations of `turns` messages; returns the report."""
+    latencies, first_tokens, failures = [], [], []
+    lock = threading.Lock()
+    fallbacks = [0]
+    fallback_response = engine._fallback_response
+
+    def counting_fallback(context):
+        with lock:
+            fallbacks[0] += 1
+        return fallback_response(context)
+
+    engine._fallback_response = counting_fallback
+    start_gate = threading.Barrier(sessions + 1)
+
+    def session(index):
+        session_id = f"load-{index}"
+        start_gate.wait()
+        for turn in range(turns):
+            query = QUERIES[(index + turn) % len(QUERIES)]
+            started = time.perf_counter()
+            try:
+                if stream:
+                    first = None
+                    for _ in engine.get_response_stream(query, session_id):
+                        if first is None:
+                            first = time.perf_counter() - started
+                else:
+                    engine.get_response(query, session_id)
+            except Exception as e:
+                with lock:
+                    failures.append(repr(e))
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if stream and first is not None:
+                    first_tokens.append(first)
+            if think_time:
+                time.sleep(think_time)
+        engine.clear_memory(session_id)
+
+    threads = [threading.Thread(target=session, args=(i,), daemon=True) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    start_gate.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    engine._fallback_response = fallback_response
+
+    return {
+        "sessions": sessions,
+        "turns": turns,
+        "stream": stream,
+        "requests": len(latencies) + len(failures),
+        "exceptions": len(failures),
+        "fallback_replies": fallbacks[0],
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency": _percentiles(latencies),
+        "first_token": _percentiles(first_tokens) if stream else None,
+        "endpoints": engine.endpoint_stats(),
+        "errors": failures[:10],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test DigitalTwinChat with concurrent sessions.")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent sessions (default: %(default)s)")
+    parser.add_argument("--turns", type=int, default=5, help="messages per session (default: %(default)s)")
+    parser.add_argument("--stream", action="store_true", help="use get_response_stream and report time to first token")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between a session's messages")
+    parser.add_argument("--url", help="chat completions URL to test (default: an in-process mock)")
+    parser.add_argument("--kb", help="knowledge base directory to retrieve from (default: no retrieval)")
+    parser.add_argument("--hedge", action="store_true", help="enable hedged requests")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mock = None
+    url = args.url
+    if url is None:
+        mock = MockLLMServer(config_from_args(args)).start()
+        url = mock.url
+        os.environ.setdefault("HF_TOKEN", "mock")
+
+    text_search = None
+    if args.kb:
+        from vector_store import SimpleTextSearch
+        text_search = SimpleTextSearch(args.kb)
+    engine = DigitalTwinChat(text_search, pool_size=max(10, args.sessions),
+                             max_sessions=max(1000, args.sessions), hedge_requests=args.hedge)
+    engine.api_url = url
+
+    print(f"Load test: {args.sessions} sessions x {args.turns} turns against {url}", file=sys.stderr)
+    try:
+        # The engine reports API errors with print(); keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_load(engine, args.sessions, args.turns, args.stream, args.think_ms / 1000.0)
+    finally:
+        engine.close()
+        if mock is not None:
+            mock.stop()
+    report["url"] = url
+    if mock is not None:
+        report["mock_server"] = mock.stats()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Low-overhead latency metrics for the chat pipeline.
+
+Each pipeline stage records its duration into a fixed-bucket histogram in
+the process-wide registry `METRICS` (a bisect and three additions under a
+lock). Durations recorded while a `Trace` is active are also attributed to
+that trace, so one slow chat turn can be broken down by stage and appended
+to an optional slow-request log (JSON lines).
+
+Metrics are exported as Prometheus text or JSON, directly or over HTTP with
+`serve_metrics(port)` (GET /metrics, /metrics.json).
+
+Stage names used by the app:
+    kb_load_seconds, kb_refresh_seconds, search_seconds, context_pack_seconds,
+    retrieval_seconds, prompt_build_seconds, http_connect_seconds,
+    http_first_byte_seconds, http_total_seconds, llm_first_token_seconds,
+    chat_turn_seconds, streamlit_render_seconds, streamlit_script_seconds,
+    archive_search_seconds, archive_context_pack_seconds (conversation archive)
+"""
+import bisect
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the histogram buckets; one more bucket catches the rest
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_PREFIX = "digital_twin_"
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; thread-safe."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q):
+        """Estimate the q-quantile (0..1) by interpolating inside its bucket."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self._lock:
+            count, total = self.count, self.sum
+        return {
+            "count": count,
+            "sum_s": round(total, 6),
+            "mean_s": round(total / count, 6) if count else None,
+            "p50_s": self.quantile(0.5),
+            "p95_s": self.quantile(0.95),
+            "p99_s": self.quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """Named histograms plus the optional slow-request log."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.slow_log_path = None
+        self.slow_threshold = 5.0
+        self._slow_log_lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, seconds):
+        """Record a duration, also attributing it to the active trace, if any."""
+        self.histogram(name).observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, seconds)
+
+    def configure_slow_log(self, path, threshold=5.0):
+        """Append traces that take at least `threshold` seconds to `path` (None disables)."""
+        self.slow_log_path = str(path) if path else None
+        self.slow_threshold = threshold
+
+    def log_slow(self, trace, total):
+        if self.slow_log_path is None or total < self.slow_threshold:
+            return
+        record = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "name": trace.name,
+            "total_s": round(total, 4),
+            "stages": {stage: round(seconds, 4) for stage, seconds in trace.stages.items()},
+            **trace.attrs,
+        }
+        try:
+            with self._slow_log_lock, open(self.slow_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"Error writing slow request log {self.slow_log_path}: {e}")
+
+    def snapshot(self):
+        """All histograms as {name: {count, sum_s, mean_s, p50_s, p95_s, p99_s}}."""
+        with self._lock:
+            items = sorted(self._histograms.items())
+        return {name: histogram.snapshot() for name, histogram in items}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format (cumulative buckets)."""
+        with self._lock:
+            items = sorted(self._histograms.items())
+        lines = []
+        for name, histogram in items:
+            metric = PROMETHEUS_PREFIX + name
+            with histogram._lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum {total}")
+            lines.append(f"{metric}_count {count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+class Trace:
+    """Per-request breakdown: total time of one operation and the stages inside it."""
+
+    def __init__(self, name, registry=METRICS, **attrs):
+        self.name = name
+        self.registry = registry
+        self.attrs = attrs
+        self.stages = {}
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def active(self):
+        """Attribute durations recorded in this context (and tasks started from it) to the trace."""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def run(self, fn, *args, **kwargs):
+        """Call fn with the trace active - for work handed to another thread."""
+        with self.active():
+            return fn(*args, **kwargs)
+
+    def finish(self):
+        """Record the total under the trace name and log it if slow; returns the total."""
+        total = time.perf_counter() - self.start
+        self.registry.histogram(self.name).observe(total)
+        self.registry.log_slow(self, total)
+        return total
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def timed(name, registry=METRICS):
+    """Time the enclosed block into histogram `name` (and the active trace)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        registry = self.server.registry
+        if self.path == "/metrics":
+            body, content_type = registry.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = registry.to_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(port, host="127.0.0.1", registry=METRICS):
+    """Serve /metrics (Prometheus) and /metrics.json from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,238 @@
+"""
+Local stand-in for an OpenAI-style /v1/chat/completions endpoint.
+
+Replies are made-up sentences, so nothing is spent and no network is needed.
+Latency, error rates and streaming speed are configurable to imitate a real
+provider - including a slow tail and outages. Point the app at it with
+LLM_API_URL:
+
+    python mock_llm_server.py --port 8001 --latency-ms 300 --error-rate 0.02
+    LLM_API_URL=http://127.0.0.1:8001/v1/chat/completions streamlit run app.py
+
+`load_test.py` starts one in-process when no --url is given.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+_WORDS = ("love", "always", "remember", "together", "smile", "sweet", "heart", "dear",
+          "forever", "happy", "moments", "you", "me", "us", "and", "the", "our", "so")
+
+
+class MockConfig:
+    """Behaviour of the mock endpoint.
+
+    - latency_ms / latency_dist / latency_sigma: time before the reply (or
+      before the first token when streaming); "fixed", "uniform" over
+      [0, 2 * latency_ms], or "lognormal" with median latency_ms.
+    - error_rate: share of requests answered with `error_status` (and a
+      Retry-After of `retry_after` seconds if set).
+    - hang_rate: share of requests that stall for `hang_seconds` before
+      replying, to trigger client read timeouts.
+    - tokens / token_delay_ms: reply length and the gap between streamed tokens.
+    """
+
+    def __init__(self, latency_ms=200.0, latency_dist="lognormal", latency_sigma=0.5,
+                 error_rate=0.0, error_status=503, retry_after=None,
+                 hang_rate=0.0, hang_seconds=60.0, tokens=40, token_delay_ms=15.0, seed=None):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {latency_dist!r}; expected one of {LATENCY_DISTRIBUTIONS}")
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.tokens = tokens
+        self.token_delay_ms = token_delay_ms
+        self.seed = seed
+
+    def latency(self, rng):
+        """Sample one delay in seconds."""
+        if self.latency_dist == "fixed":
+            ms = self.latency_ms
+        elif self.latency_dist == "uniform":
+            ms = rng.uniform(0, 2 * self.latency_ms)
+        else:
+            ms = rng.lognormvariate(0, self.latency_sigma) * self.latency_ms
+        return ms / 1000.0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": f"no route {self.path}"}})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON"}})
+            return
+
+        config = server.config
+        with server.lock:
+            server.counters["requests"] += 1
+            roll = server.rng.random()
+            delay = config.latency(server.rng)
+        if roll < config.error_rate:
+            server.count("errors")
+            headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else {}
+            self._send_json(config.error_status, {"error": {"message": "mock overload"}}, headers)
+            return
+        if roll < config.error_rate + config.hang_rate:
+            server.count("hangs")
+            delay = config.hang_seconds
+
+        reply = self._reply_tokens(body, server)
+        time.sleep(delay)
+        try:
+            if body.get("stream"):
+                self._stream(body, reply, config)
+            else:
+                self._send_json(200, self._completion(body, "".join(reply)))
+            server.count("completed")
+        except (BrokenPipeError, ConnectionResetError):
+            server.count("disconnected")  # client gave up (timeout, hedge or cancel)
+
+    def _reply_tokens(self, body, server):
+        with server.lock:
+            words = [server.rng.choice(_WORDS) for _ in range(max(1, server.config.tokens))]
+        words[0] = words[0].capitalize()
+        return [words[0]] + [" " + word for word in words[1:]] + ["."]
+
+    def _completion(self, body, content):
+        return {
+            "id": "mock-completion",
+            "object": "chat.completion",
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+        }
+
+    def _stream(self, body, reply, config):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(reply):
+            if i:
+                time.sleep(config.token_delay_ms / 1000.0)
+            chunk = {"id": "mock-completion", "object": "chat.completion.chunk",
+                     "model": body.get("model", "mock"),
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """The mock endpoint; `start()` serves it from a background thread."""
+
+    daemon_threads = True
+    # Load tests open many connections at once; the default backlog of 5 resets some
+    request_queue_size = 128
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.config = config or MockConfig()
+        self.rng = random.Random(self.config.seed)
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "completed": 0, "errors": 0, "hangs": 0, "disconnected": 0}
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_config_arguments(parser):
+    """Add the MockConfig options to an argparse parser."""
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="median reply latency (default: %(default)s)")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal spread (default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with errors")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of requests that stall")
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per reply (default: %(default)s)")
+    parser.add_argument("--token-delay-ms", type=float, default=15.0, help="gap between streamed tokens")
+    parser.add_argument("--seed", type=int)
+
+
+def config_from_args(args):
+    return MockConfig(
+        latency_ms=args.latency_ms, latency_dist=args.latency_dist, latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+        hang_rate=args.hang_rate, hang_seconds=args.hang_seconds,
+        tokens=args.tokens, token_delay_ms=args.token_delay_ms, seed=args.seed,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock /v1/chat/completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = MockLLMServer(config_from_args(args), args.host, args.port)
+    print(f"Mock LLM endpoint: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats()))
+
+
+if __name__ == "__main__":
+    main()
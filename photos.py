@@ -0,0 +1,260 @@
+"""
+Photo derivatives for the memory timeline.
+
+Uploaded photos are kept as they are, but the timeline shows small renditions
+instead: each photo is turned, in a worker pool, into an EXIF-oriented
+thumbnail and a medium rendition capped at RENDITIONS pixels on the longer
+side, saved as WebP (JPEG where Pillow lacks WebP support). Derivatives are
+content-addressed - stored under the SHA-256 of the original's bytes - so a
+re-uploaded or renamed photo reuses them, and a changed one gets new ones.
+
+Create the derivatives of existing photos once with:
+
+    python photos.py --backfill data/photos
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, wait
+from pathlib import Path
+
+from PIL import Image, ImageOps, features
+
+# rendition -> longest side in pixels
+RENDITIONS = {"thumb": 480, "medium": 1280}
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+QUALITY = 80
+
+FORMAT, EXTENSION = ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's bytes."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def derivative_path(cache_dir, digest, rendition):
+    return Path(cache_dir) / digest[:2] / f"{digest}_{rendition}{EXTENSION}"
+
+
+def make_derivatives(source, cache_dir, digest=None):
+    """Write every missing rendition of `source`; returns {rendition: path}.
+
+    A top-level function so that process pools can run it.
+    """
+    digest = digest or file_digest(source)
+    paths = {rendition: derivative_path(cache_dir, digest, rendition) for rendition in RENDITIONS}
+    missing = [rendition for rendition, path in paths.items() if not path.exists()]
+    if not missing:
+        return paths
+    with Image.open(source) as original:
+        # JPEGs can be decoded at 1/2 - 1/8 scale, much faster than full size
+        largest = max(RENDITIONS[rendition] for rendition in missing)
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        transparent = "A" in image.getbands() or "transparency" in image.info
+        mode = "RGBA" if transparent and FORMAT == "WEBP" else "RGB"
+        if image.mode != mode:
+            image = image.convert(mode)
+        # Largest first, so each smaller rendition is scaled down from the previous one
+        for rendition in sorted(missing, key=RENDITIONS.get, reverse=True):
+            size = RENDITIONS[rendition]
+            image.thumbnail((size, size), Image.LANCZOS)
+            path = paths[rendition]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            image.save(tmp, FORMAT, quality=QUALITY, **({"method": 4} if FORMAT == "WEBP" else {"optimize": True}))
+            os.replace(tmp, path)
+    return paths
+
+
+def process_photo(source, cache_dir, digest=None):
+    """Digest `source` (unless given) and write its missing renditions; returns (digest, {rendition: path})."""
+    digest = digest or file_digest(source)
+    return digest, make_derivatives(source, cache_dir, digest)
+
+
+class PhotoPipeline:
+    """Creates and looks up photo derivatives in a background pool; thread-safe.
+
+    Originals are hashed in the pool too, never on the caller's thread.
+    Digests are remembered per (path, size, mtime) in memory and in
+    digests.sqlite3 next to the renditions, so after a restart looking up a
+    known photo still costs one stat rather than reading the file.
+    """
+
+    def __init__(self, cache_dir, workers=None, processes=False):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        workers = workers or min(4, os.cpu_count() or 1)
+        pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self._pool = pool(max_workers=workers)
+        self._digests = {}  # path -> (size, mtime_ns, digest)
+        self._pending = {}  # path -> Future
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.cache_dir / "digests.sqlite3"), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS digests ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL)"
+        )
+
+    def known_digest(self, path, stat=None):
+        """Remembered content digest of the photo at `path`, or None if it has to be hashed."""
+        path = str(path)
+        stat = stat or os.stat(path)
+        with self._lock:
+            cached = self._digests.get(path)
+            if cached is None:
+                row = self._db.execute("SELECT size, mtime_ns, digest FROM digests WHERE path = ?",
+                                       (path,)).fetchone()
+                if row is not None:
+                    cached = self._digests[path] = tuple(row)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        return None
+
+    def _remember(self, path, stat, digest):
+        with self._lock:
+            self._digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+            self._db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                             (path, stat.st_size, stat.st_mtime_ns, digest))
+
+    def digest(self, path, data=None):
+        """Content digest of the photo at `path` (pass `data` when its bytes are at hand); may read the file."""
+        stat = os.stat(path)
+        digest = self.known_digest(path, stat)
+        if digest is None:
+            digest = hashlib.sha256(data).hexdigest() if data is not None else file_digest(path)
+            self._remember(str(path), stat, digest)
+        return digest
+
+    def submit(self, path, data=None):
+        """Queue derivative creation for a photo; None if all its renditions exist.
+
+        Returns a Future of (digest, {rendition: path}). Only `data`, when
+        given, is hashed here; otherwise an unknown photo is hashed by the
+        worker.
+        """
+        path = str(path)
+        stat = os.stat(path)
+        digest = self.known_digest(path, stat)
+        if digest is None and data is not None:
+            digest = self.digest(path, data)
+        if digest is not None and all(derivative_path(self.cache_dir, digest, r).exists() for r in RENDITIONS):
+            return None
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                future = self._pool.submit(process_photo, path, str(self.cache_dir), digest)
+                self._pending[path] = future
+                future.add_done_callback(lambda done: self._done(path, stat, done))
+        return future
+
+    def _done(self, path, stat, future):
+        with self._lock:
+            self._pending.pop(path, None)
+        if not future.cancelled() and future.exception() is None:
+            self._remember(path, stat, future.result()[0])
+
+    def prefetch(self, paths):
+        """Queue every photo in `paths` whose derivatives are missing."""
+        for path in paths:
+            try:
+                self.submit(path)
+            except OSError as e:
+                print(f"Error reading photo {path}: {e}")
+
+    def get(self, path, rendition="medium", timeout=30.0):
+        """Path of the rendition, created now (in the pool) if needed; None if the photo can't be read.
+
+        Waits at most `timeout` seconds for a rendition still being created,
+        then returns None; with timeout=0 it only queues the work (see
+        `pending`), so a page can show a placeholder instead of waiting.
+        """
+        try:
+            digest = self.known_digest(path)
+            if digest is not None:
+                target = derivative_path(self.cache_dir, digest, rendition)
+                if target.exists():
+                    return str(target)
+            future = self.submit(path)
+            if future is None:
+                return str(derivative_path(self.cache_dir, self.known_digest(path), rendition))
+            _, paths = future.result(timeout=timeout)
+            return str(paths[rendition]) if paths[rendition].exists() else None
+        except TimeoutError:
+            return None
+        except Exception as e:
+            print(f"Error creating {rendition} rendition of {path}: {e}")
+            return None
+
+    def pending(self, path):
+        """Whether the photo's renditions are queued or being created."""
+        with self._lock:
+            return str(path) in self._pending
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
+
+
+def backfill(photo_dir, cache_dir, workers=None, processes=True):
+    """Create the missing derivatives of every photo under `photo_dir`; returns counts."""
+    photos = [
+        path for path in sorted(Path(photo_dir).rglob("*"))
+        if path.suffix.lower() in PHOTO_EXTENSIONS and Path(cache_dir) not in path.parents
+    ]
+    pipeline = PhotoPipeline(cache_dir, workers, processes)
+    futures, created, failed = [], 0, 0
+    try:
+        for path in photos:
+            try:
+                future = pipeline.submit(path)
+            except OSError as e:
+                print(f"Error reading photo {path}: {e}")
+                failed += 1
+                continue
+            if future is not None:
+                futures.append((path, future))
+        wait([future for _, future in futures])
+        for path, future in futures:
+            if future.exception() is not None:
+                print(f"Error creating renditions of {path}: {future.exception()}")
+                failed += 1
+            else:
+                created += 1
+    finally:
+        pipeline.close()
+    return {"photos": len(photos), "created": created, "failed": failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create thumbnail and medium renditions of memory photos.")
+    parser.add_argument("--backfill", metavar="PHOTO_DIR", default="data/photos",
+                        help="folder of photos to process (default: %(default)s)")
+    parser.add_argument("--cache-dir", default="data/photo_cache", help="derivative folder (default: %(default)s)")
+    parser.add_argument("--workers", type=int, help="pool size (default: CPU count, at most 4)")
+    parser.add_argument("--threads", action="store_true", help="use threads instead of processes")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    counts = backfill(args.backfill, args.cache_dir, args.workers, processes=not args.threads)
+    print(f"{counts['photos']} photos: {counts['created']} processed, {counts['failed']} failed, rest up to date "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Persistent cache of LLM responses in a local SQLite file.
+
+Entries are keyed by a SHA-256 fingerprint of the request payload
+(messages, model and sampling parameters), expire after `ttl` seconds, and
+the least recently used entries are evicted beyond `max_entries`. Eviction
+runs every `evict_every` puts rather than on each one, so the table may
+briefly hold that many extra entries. Hit and miss counters cover the
+lifetime of the ResponseCache object. The methods block on SQLite: call
+them from a worker thread in async code.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """SQLite-backed TTL + LRU cache of chat completion texts; safe to share across threads."""
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=10000, evict_every=64):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._puts = 0  # puts since the last eviction
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, content TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+
+    @staticmethod
+    def key(payload):
+        """Fingerprint of a chat completions payload; `stream` does not change the answer."""
+        canonical = {name: value for name, value in payload.items() if name != "stream"}
+        return hashlib.sha256(
+            json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key):
+        """Return the cached content for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, content):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, content, now, now),
+            )
+            self._puts += 1
+            if self._puts >= self.evict_every:
+                self._evict(now)
+
+    def _evict(self, now):
+        """Delete expired entries, then the least recently used ones beyond `max_entries`."""
+        self._puts = 0
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        excess = self._size() - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN"
+                " (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def _size(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        """Hit/miss/eviction counters, hit ratio and current number of entries."""
+        with self._lock:
+            size = self._size()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": size,
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,202 @@
+"""
+Sharded, multi-process knowledge-base search.
+
+Knowledge-base files are partitioned across N worker processes by a hash of
+their path. Each worker runs its own SimpleTextSearch over its shard, loaded
+from a per-shard memory-mapped snapshot after the first start. A query is
+answered in two fan-out rounds over all shards in parallel:
+
+1. collect document frequencies for the query terms, so BM25 uses corpus-wide
+   statistics and scores from different shards are comparable;
+2. score locally and return the shard's top k (score, chunk) pairs, which are
+   merged into the global top k.
+
+Each worker holds its own GIL, so throughput and latency scale with cores
+once per-query scoring outweighs the two IPC round trips - i.e. for large
+corpora; small knowledge bases are faster with a single SimpleTextSearch.
+`ShardedTextSearch` keeps the `search` / `get_context` interface of
+SimpleTextSearch.
+"""
+import heapq
+import multiprocessing
+import os
+import threading
+
+from context_packing import pack_context
+from vector_store import _MISSING, SimpleTextSearch, _LRUCache, _query_key
+
+
+def _merge_stats(stats):
+    n_docs = sum(s[0] for s in stats)
+    total_length = sum(s[1] for s in stats)
+    dfs = {}
+    for _, _, shard_dfs in stats:
+        for term, df in shard_dfs.items():
+            dfs[term] = dfs.get(term, 0) + df
+    return n_docs, total_length, dfs
+
+
+def _worker(conn, knowledge_base_path, shard, options):
+    """Serve one shard: reply ("ok", result) or ("error", message) per request."""
+    try:
+        engine = SimpleTextSearch(knowledge_base_path, shard=shard, **options)
+    except Exception as e:
+        conn.send(("error", f"shard {shard[0]} failed to load: {e!r}"))
+        return
+    conn.send(("ok", None))
+
+    handlers = {
+        "corpus_stats": engine.corpus_stats,
+        "search": lambda queries, k, mode, stats: [
+            engine.search_scored(query, k, mode, stats) for query in queries
+        ],
+        "refresh": engine.refresh,
+    }
+    try:
+        while True:
+            try:
+                op, args = conn.recv()
+            except EOFError:
+                return
+            if op == "close":
+                return
+            try:
+                conn.send(("ok", handlers[op](*args)))
+            except Exception as e:
+                conn.send(("error", f"shard {shard[0]} {op} failed: {e!r}"))
+    finally:
+        engine.wait_for_snapshot()
+
+
+class ShardedTextSearch:
+    """SimpleTextSearch spread over `shards` worker processes (default: one per core).
+
+    Keyword and dense scores are merged exactly. In hybrid mode each shard
+    normalises BM25 against its own best hit, so fusion is approximate.
+    """
+
+    def __init__(self, knowledge_base_path="knowledge_base", shards=None, cache_size=256, **options):
+        self.knowledge_base_path = knowledge_base_path
+        self.mode = options.get("mode", "keyword")
+        self.n_shards = shards or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._version = 0
+        self._context_cache = _LRUCache(cache_size)
+
+        # Spawn, not fork: the parent may be running Streamlit's threads
+        ctx = multiprocessing.get_context("spawn")
+        self._conns = []
+        self._procs = []
+        for index in range(self.n_shards):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(
+                target=_worker,
+                args=(child, knowledge_base_path, (index, self.n_shards), options),
+                daemon=True,
+            )
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+        try:
+            self._gather()  # wait for every shard to finish loading
+        except Exception:
+            self.close()
+            raise
+
+    def _gather(self):
+        results = []
+        errors = []
+        for conn in self._conns:
+            status, result = conn.recv()
+            if status == "ok":
+                results.append(result)
+            else:
+                errors.append(result)
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return results
+
+    def _fan_out(self, op, *args):
+        """Send one request to every shard, then collect the replies in shard order."""
+        with self._lock:
+            for conn in self._conns:
+                conn.send((op, args))
+            return self._gather()
+
+    def search_scored_many(self, queries, k=3, mode=None):
+        """Return one list of (score, doc) pairs per query, best first."""
+        queries = list(queries)
+        mode = mode or self.mode
+        stats = None
+        if mode != "dense":
+            stats = _merge_stats(self._fan_out("corpus_stats", queries))
+        per_shard = self._fan_out("search", queries, k, mode, stats)
+        merged = []
+        for i in range(len(queries)):
+            # Best score first; ties go to the lower shard, then the shard's own order
+            candidates = (
+                (score, shard, rank, doc)
+                for shard, results in enumerate(per_shard)
+                for rank, (score, doc) in enumerate(results[i])
+            )
+            top = heapq.nsmallest(k, candidates, key=lambda c: (-c[0], c[1], c[2]))
+            merged.append([(score, doc) for score, _, _, doc in top])
+        return merged
+
+    def search(self, query, k=3, mode=None):
+        return [doc for _, doc in self.search_scored_many([query], k, mode)[0]]
+
+    def search_many(self, queries, k=3):
+        """Batch search with two round trips per batch instead of per query."""
+        return [[doc for _, doc in results] for results in self.search_scored_many(queries, k)]
+
+    def get_context(self, query, k=3, token_budget=None):
+        """Get formatted context string from search results (cached like SimpleTextSearch).
+
+        Passages are deduplicated and packed into `token_budget` like
+        SimpleTextSearch.get_context, but hits from different shards carry no
+        chunk positions, so adjacent chunks are not merged.
+        """
+        budget = SimpleTextSearch.context_token_budget if token_budget is None else token_budget
+        key = (_query_key(query, self.mode), k, self.mode, self._version)
+        hits = self._context_cache.get(key, _MISSING)
+        if hits is _MISSING:
+            results = self.search(query, k)
+            hits = tuple((rank, 0, doc["content"]) for rank, doc in enumerate(results))
+            self._context_cache.put(key, hits)
+        return pack_context(hits, budget, SimpleTextSearch.overlap)
+
+    def cache_stats(self):
+        return self._context_cache.stats()
+
+    def refresh(self):
+        """Refresh every shard; returns the merged added/changed/removed paths."""
+        changes = {"added": [], "changed": [], "removed": []}
+        for shard_changes in self._fan_out("refresh"):
+            for kind, paths in shard_changes.items():
+                changes[kind].extend(paths)
+        if any(changes.values()):
+            self._version += 1
+        return {kind: sorted(paths) for kind, paths in changes.items()}
+
+    def close(self):
+        """Stop the worker processes."""
+        for conn in self._conns:
+            try:
+                conn.send(("close", ()))
+                conn.close()
+            except OSError:
+                pass
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        self._conns = []
+        self._procs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
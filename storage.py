@@ -0,0 +1,242 @@
+"""
+Transactional storage of memories and journal entries in a local SQLite file.
+
+Each entry is one row, so adding or deleting costs the same however many
+entries there are - nothing is rewritten as a whole. IDs come from an
+AUTOINCREMENT key and are never reused, even after deletions. WAL mode lets
+several app sessions read while one writes, and each write is a single
+transaction, so concurrent sessions no longer overwrite each other.
+
+`page` walks a collection in date (or another indexed column) order with
+a keyset cursor, so any page costs an index seek plus `limit` rows - the
+first screen of a timeline is as fast with thousands of entries as with ten.
+
+Every change bumps a per-collection version counter (kept by triggers, so
+writes from other processes count too). `snapshot` returns an immutable
+tuple of entries that is reused until the version changes, so callers such
+as Streamlit reruns pay one primary-key lookup instead of a reload.
+
+Existing data/memories.json and data/journal.json files are imported once by
+`migrate_json` and renamed to *.json.migrated; a row in the migrations table
+records the import, so sessions starting at the same time import only once.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from types import MappingProxyType
+
+# collection -> (columns after id, indexed columns)
+COLLECTIONS = {
+    "memories": (
+        ("title", "date", "description", "category", "mood", "photo", "created_at"),
+        ("date", "category", "mood"),
+    ),
+    "journal": (
+        ("title", "content", "mood", "date", "time", "created_at"),
+        ("date", "mood", "created_at"),
+    ),
+}
+
+# Pages kept for reuse (e.g. prefetched next pages)
+PAGE_CACHE_SIZE = 64
+
+
+class Storage:
+    """SQLite-backed memories and journal; safe to share across threads."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Wait for other processes' write transactions instead of failing at once
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._snapshots = {}  # collection -> (version, tuple of read-only entries)
+        self._pages = OrderedDict()  # (collection, version, query) -> page, least recently used first
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS versions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, applied_at REAL NOT NULL)")
+        for collection, (columns, indexed) in COLLECTIONS.items():
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {collection} ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                + ", ".join(f"{column} TEXT" for column in columns) + ")"
+            )
+            for column in indexed:
+                # On the expression `page` sorts by, so a missing value pages like ''
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {collection}_{column}_key ON {collection} (COALESCE({column}, ''))"
+                )
+            self._conn.execute("INSERT OR IGNORE INTO versions VALUES (?, 0)", (collection,))
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                self._conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {collection}_{event.lower()}_version AFTER {event} ON {collection}"
+                    f" BEGIN UPDATE versions SET version = version + 1 WHERE collection = '{collection}'; END"
+                )
+
+    @staticmethod
+    def _columns(collection):
+        if collection not in COLLECTIONS:
+            raise ValueError(f"Unknown collection {collection!r}; expected one of {tuple(COLLECTIONS)}")
+        return COLLECTIONS[collection][0]
+
+    def add(self, collection, entry):
+        """Insert `entry` (its "id", if any, is ignored) and return it with the new id."""
+        columns = self._columns(collection)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT INTO {collection} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [entry.get(column) for column in columns],
+            )
+        return {"id": cursor.lastrowid, **{column: entry.get(column) for column in columns}}
+
+    def delete(self, collection, entry_id):
+        """Delete one entry; returns whether it existed."""
+        self._columns(collection)
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM {collection} WHERE id = ?", (entry_id,))
+        return cursor.rowcount > 0
+
+    def all(self, collection):
+        """Every entry of the collection as a dict, oldest first."""
+        self._columns(collection)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM {collection} ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+    def version(self, collection):
+        """Counter that changes whenever the collection is written, by any connection."""
+        self._columns(collection)
+        with self._lock:
+            return self._version(collection)
+
+    def _version(self, collection):
+        return self._conn.execute("SELECT version FROM versions WHERE collection = ?", (collection,)).fetchone()[0]
+
+    def snapshot(self, collection):
+        """Every entry, oldest first, as a tuple of read-only mappings.
+
+        The tuple is shared between callers and rebuilt only after the
+        collection changed.
+        """
+        return self.versioned_snapshot(collection)[1]
+
+    def versioned_snapshot(self, collection):
+        """(version, snapshot) of the collection, read consistently."""
+        self._columns(collection)
+        with self._lock:
+            version = self._version(collection)
+            cached = self._snapshots.get(collection)
+            if cached is not None and cached[0] == version:
+                return cached
+            # Version and rows from one read transaction, so they match
+            self._conn.execute("BEGIN")
+            try:
+                version = self._version(collection)
+                rows = self._conn.execute(f"SELECT * FROM {collection} ORDER BY id").fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+            entries = tuple(MappingProxyType(dict(row)) for row in rows)
+            self._snapshots[collection] = (version, entries)
+            return version, entries
+
+    def page(self, collection, order="date", limit=20, cursor=None):
+        """Entries sorted by `order` (newest / highest first), `limit` at a time.
+
+        `cursor` is None for the first page, then the cursor returned with the
+        previous page. Returns (tuple of read-only entries, next cursor or
+        None on the last page). Pages are cached until the collection
+        changes. Filtering and text search are TimelineIndex's job.
+        """
+        self._columns(collection)
+        if order not in COLLECTIONS[collection][1]:
+            raise ValueError(f"Can only page {collection} by an indexed column {COLLECTIONS[collection][1]}")
+        key = (order, limit, tuple(cursor) if cursor else None)
+        with self._lock:
+            version = self._version(collection)
+            cached = self._pages.get((collection, version, key))
+            if cached is not None:
+                self._pages.move_to_end((collection, version, key))
+                return cached
+
+            # NULLs sort as '' (last); compared as NULL they would end the keyset walk early
+            column = f"COALESCE({order}, '')"
+            sql, params = f"SELECT * FROM {collection}", []
+            if cursor:
+                # Keyset pagination: continue strictly after the previous page's last (order, id)
+                value = cursor[0] if cursor[0] is not None else ""
+                sql += f" WHERE ({column} < ? OR ({column} = ? AND id < ?))"
+                params = [value, value, cursor[1]]
+            sql += f" ORDER BY {column} DESC, id DESC LIMIT ?"
+            rows = self._conn.execute(sql, params + [limit + 1]).fetchall()
+            entries = tuple(MappingProxyType(dict(row)) for row in rows[:limit])
+            next_cursor = (entries[-1][order], entries[-1]["id"]) if len(rows) > limit else None
+
+            self._pages[(collection, version, key)] = (entries, next_cursor)
+            while len(self._pages) > PAGE_CACHE_SIZE:
+                self._pages.popitem(last=False)
+            return entries, next_cursor
+
+    def count(self, collection):
+        """Number of entries in the collection."""
+        self._columns(collection)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {collection}").fetchone()[0]
+
+    def migrate_json(self, collection, json_path):
+        """Import a legacy JSON array file once, then rename it to *.json.migrated.
+
+        Original ids are kept; entries whose id is already taken (the old
+        len(list) ids collided after deletions) get a fresh one. The import
+        and its marker row commit together, so of several processes
+        migrating at once only the first imports. Returns the number of
+        entries imported.
+        """
+        columns = self._columns(collection)
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error migrating {json_path}: {e}")
+            return 0
+
+        marker = f"json:{collection}"
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                done = self._conn.execute("SELECT 1 FROM migrations WHERE name = ?", (marker,)).fetchone()
+                if done is None:
+                    taken = {row[0] for row in self._conn.execute(f"SELECT id FROM {collection}")}
+                    for entry in entries:
+                        entry_id = entry.get("id")
+                        if not isinstance(entry_id, int) or entry_id in taken:
+                            entry_id = None
+                        cursor = self._conn.execute(
+                            f"INSERT INTO {collection} (id, {', '.join(columns)}) VALUES ({placeholders})",
+                            [entry_id] + [entry.get(column) for column in columns],
+                        )
+                        taken.add(cursor.lastrowid)
+                    self._conn.execute("INSERT INTO migrations VALUES (?, ?)", (marker, time.time()))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        try:
+            json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+        except FileNotFoundError:
+            pass  # renamed by the process that imported it
+        return 0 if done is not None else len(entries)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,18 @@
+from vector_store import SimpleTextSearch
+
+
+def test_search_many_matches_search_one_query_at_a_time(tmp_path):
+    (tmp_path / "a.txt").write_text("Granny baked apple pie every Sunday. " * 30)
+    (tmp_path / "b.txt").write_text("We hiked the mountain trail in spring, then had apple juice by the lake.")
+    (tmp_path / "c.txt").write_text("Our dog loves the park and the lake.")
+    search = SimpleTextSearch(str(tmp_path), use_snapshot=False)
+    search.sync_records("memory", [
+        {"id": 1, "text": "First trip to Paris in the rain.", "date": "2020-06-01", "category": "Travel"},
+        {"id": 2, "text": "Picnic with apple pie at the lake.", "date": "2021-07-04", "category": "Romantic"},
+    ])
+    search.update_records("memory", removed=[1])
+    queries = ["apple pie", "lake", "paris rain", "dog park lake", "nothing matches", "", "Apple APPLE apple"]
+
+    for k in (1, 3, 10):
+        assert search.search_many(queries, k) == [search.search(query, k) for query in queries]
+    assert search._matrix is not None  # answered by the BM25 matrix, not query by query
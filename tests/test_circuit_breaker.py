@@ -0,0 +1,56 @@
+import time
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, EndpointHealth
+
+
+def test_opens_after_consecutive_failures_only():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # a success resets the count
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats() == {"state": OPEN, "consecutive_failures": 3, "trips": 1}
+
+
+def test_half_open_lets_one_probe_through_and_its_outcome_decides():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+
+    assert breaker.allow()  # the probe
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # only one at a time
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.trips == 2
+    assert not breaker.allow()  # the reset timeout starts over
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()  # abandoned probe: another may go
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+def test_hedge_delay_waits_for_samples_and_uses_the_p95():
+    health = EndpointHealth(window=100)
+    for i in range(19):
+        health.latency.record(1.0)
+    assert health.hedge_delay(stream=False) is None
+
+    for i in range(81):
+        health.latency.record(1.0 + i / 10)
+    assert health.hedge_delay(stream=False) == health.latency.percentile(95)
+    assert health.hedge_delay(stream=True) is None  # first-token samples are separate
+
+    for _ in range(20):
+        health.first_token.record(0.01)
+    assert health.hedge_delay(stream=True) == 0.5  # floor
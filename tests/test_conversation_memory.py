@@ -0,0 +1,59 @@
+import threading
+
+from conversation_memory import TurnArchive
+from metrics import METRICS
+
+
+def exchange(question, answer):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+def test_add_queues_exchanges_for_the_background_writer(monkeypatch):
+    archive = TurnArchive()
+    indexing = threading.Event()
+    release = threading.Event()
+    index = archive._index
+
+    def slow_index(session):
+        indexing.set()
+        release.wait(5)
+        index(session)
+
+    monkeypatch.setattr(archive, "_index", slow_index)
+    archive.add("a", exchange("Where did we go hiking?", "The mountain trail in spring."))
+    assert indexing.wait(5)
+    # The writer is busy indexing: adding must not wait for it
+    archive.add("a", exchange("What did Granny bake?", "Apple pie every Sunday."))
+    release.set()
+    monkeypatch.setattr(archive, "_index", index)
+
+    assert "Apple pie" in archive.get_context("a", "apple pie", k=1)
+
+
+def test_sessions_only_see_their_own_exchanges():
+    archive = TurnArchive(max_turns=2)
+    archive.add("a", exchange("What did Granny bake?", "Apple pie every Sunday."))
+    archive.add("b", exchange("What did you eat?", "Apple crumble at the fair."))
+    for i in range(3):
+        archive.add("b", exchange(f"Day {i}?", "Rain."))
+    archive.flush()
+
+    assert "crumble" not in archive.get_context("a", "apple")
+    assert "Granny" not in archive.get_context("b", "apple granny")
+    assert len(archive) == 3
+    archive.drop("a")
+    assert archive.get_context("a", "apple") == ""
+
+
+def test_archive_lookups_are_timed_apart_from_the_knowledge_base():
+    def count(name):
+        return METRICS.histogram(name).snapshot()["count"]
+
+    before = {name: count(name) for name in ("kb_load_seconds", "search_seconds", "archive_search_seconds")}
+    archive = TurnArchive()
+    archive.add("a", exchange("What did Granny bake?", "Apple pie every Sunday."))
+    archive.get_context("a", "apple pie")
+
+    assert count("kb_load_seconds") == before["kb_load_seconds"]
+    assert count("search_seconds") == before["search_seconds"]
+    assert count("archive_search_seconds") == before["archive_search_seconds"] + 1
@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import pytest
+
+from llm_chain import DigitalTwinChat
+from mock_llm_server import MockConfig, MockLLMServer
+
+
+@pytest.fixture
+def mock_server():
+    server = MockLLMServer(MockConfig(latency_ms=5, latency_dist="fixed", tokens=5, token_delay_ms=0, seed=1))
+    yield server.start()
+    server.stop()
+
+
+@pytest.fixture
+def engine(mock_server, monkeypatch):
+    monkeypatch.setenv("HF_TOKEN", "mock")
+    engine = DigitalTwinChat(summary_tokens=0, archive_turns=0)
+    engine.api_url = mock_server.url
+    engine.backoff_base = 0.01
+    yield engine
+    engine.close()
+
+
+def test_retries_stop_at_the_retry_budget(engine, mock_server):
+    mock_server.config.error_rate = 1.0
+    mock_server.config.retry_after = 1
+    engine.retry_budget = 1.5
+
+    async def post():
+        started = time.monotonic()
+        response = await engine._apost({"messages": []})
+        return response.status_code, time.monotonic() - started
+
+    status, elapsed = engine._run(post())
+
+    # One Retry-After wait fits the budget, a second one would not
+    assert status == 503
+    assert mock_server.stats()["requests"] == 2
+    assert elapsed < 1.5
+
+
+def test_breaker_opens_on_failures_and_a_probe_closes_it(engine, mock_server):
+    mock_server.config.error_rate = 1.0
+    mock_server.config.error_status = 500  # not retried
+    engine.breaker_failure_threshold = 3
+    engine.breaker_reset_timeout = 0.2
+
+    for _ in range(3):
+        assert engine.get_response("hello") == engine._fallback_response("")
+    assert engine.endpoint_stats()[engine.api_url]["state"] == "open"
+
+    # Open: answered from the fallback without calling the API
+    engine.get_response("hello")
+    assert mock_server.stats()["requests"] == 3
+
+    mock_server.config.error_rate = 0.0
+    time.sleep(0.25)
+    assert engine.get_response("hello") != engine._fallback_response("")
+    assert mock_server.stats()["requests"] == 4
+    assert engine.endpoint_stats()[engine.api_url]["state"] == "closed"
+
+
+def test_streaming_failure_counts_against_the_breaker(engine, mock_server):
+    mock_server.config.error_rate = 1.0
+    mock_server.config.error_status = 500
+    engine.breaker_failure_threshold = 2
+
+    for _ in range(2):
+        "".join(engine.get_response_stream("hello"))
+    assert engine.endpoint_stats()[engine.api_url]["state"] == "open"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_hedged_call_returns_the_faster_attempt_and_cancels_the_slower():
+    attempts = []
+
+    async def attempt():
+        index = len(attempts)
+        attempts.append("started")
+        try:
+            await asyncio.sleep(5 if index == 0 else 0.01)
+        except asyncio.CancelledError:
+            attempts[index] = "cancelled"
+            raise
+        return f"reply {index}"
+
+    started = time.monotonic()
+    assert run(DigitalTwinChat._hedged(attempt, 0.05)) == "reply 1"
+    assert time.monotonic() - started < 1
+    assert attempts == ["cancelled", "started"]
+
+
+def test_hedged_call_falls_back_to_the_other_attempt_when_one_fails():
+    replies = iter([None, "second"])
+
+    async def attempt():
+        await asyncio.sleep(0.1)
+        return next(replies)
+
+    assert run(DigitalTwinChat._hedged(attempt, 0.01)) == "second"
+
+
+def test_no_hedge_without_a_delay():
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "only"
+
+    assert run(DigitalTwinChat._hedged(attempt, None)) == "only"
+    assert calls == [1]
+
+
+def test_hedged_stream_continues_with_the_first_to_yield_and_closes_the_other():
+    closed = []
+
+    def make_stream():
+        index = len(closed)
+        closed.append(False)
+
+        async def stream():
+            try:
+                await asyncio.sleep(5 if index == 0 else 0.01)
+                for token in ("a", "b", "c"):
+                    yield f"{token}{index}"
+            finally:
+                closed[index] = True
+
+        return stream()
+
+    async def collect():
+        return [token async for token in DigitalTwinChat._hedged_stream(make_stream, 0.05)]
+
+    started = time.monotonic()
+    assert run(collect()) == ["a1", "b1", "c1"]
+    assert time.monotonic() - started < 1
+    assert closed == [True, True]
+
+
+def test_hedged_stream_uses_the_other_stream_when_one_ends_empty():
+    def make_stream():
+        empty = not hasattr(make_stream, "made")
+        make_stream.made = True
+
+        async def stream():
+            await asyncio.sleep(0.1)
+            if not empty:
+                yield "token"
+
+        return stream()
+
+    async def collect():
+        return [token async for token in DigitalTwinChat._hedged_stream(make_stream, 0.01)]
+
+    assert run(collect()) == ["token"]
@@ -0,0 +1,57 @@
+import threading
+
+from PIL import Image
+
+import photos
+from photos import PhotoPipeline
+
+
+def test_get_without_waiting_returns_none_until_the_thumbnail_is_made(tmp_path, monkeypatch):
+    photo = tmp_path / "beach.jpg"
+    Image.new("RGB", (1600, 1200), "pink").save(photo)
+    release = threading.Event()
+    make_derivatives = photos.make_derivatives
+
+    def slow_make_derivatives(*args):
+        release.wait(5)
+        return make_derivatives(*args)
+
+    monkeypatch.setattr(photos, "make_derivatives", slow_make_derivatives)
+    pipeline = PhotoPipeline(tmp_path / "cache", workers=1)
+    try:
+        assert pipeline.get(photo, "thumb", timeout=0) is None
+        assert pipeline.pending(photo)
+        release.set()
+        thumbnail = pipeline.get(photo, "thumb")
+        assert thumbnail is not None and max(Image.open(thumbnail).size) == photos.RENDITIONS["thumb"]
+    finally:
+        release.set()
+        pipeline.close()
+
+
+def test_originals_are_hashed_by_the_pool_and_digests_survive_a_restart(tmp_path, monkeypatch):
+    photo = tmp_path / "beach.jpg"
+    Image.new("RGB", (800, 600), "pink").save(photo)
+    hashed_on = []
+    file_digest = photos.file_digest
+
+    def recording_file_digest(path):
+        hashed_on.append(threading.current_thread())
+        return file_digest(path)
+
+    monkeypatch.setattr(photos, "file_digest", recording_file_digest)
+    pipeline = PhotoPipeline(tmp_path / "cache", workers=1)
+    try:
+        pipeline.get(photo, "thumb", timeout=0)
+        assert pipeline.get(photo, "thumb") is not None
+    finally:
+        pipeline.close()
+    assert hashed_on and threading.current_thread() not in hashed_on
+
+    hashed_on.clear()
+    restarted = PhotoPipeline(tmp_path / "cache", workers=1)
+    try:
+        assert restarted.get(photo, "thumb", timeout=0) is not None
+    finally:
+        restarted.close()
+    assert hashed_on == []
@@ -0,0 +1,17 @@
+from response_cache import ResponseCache
+
+
+def test_eviction_runs_every_few_puts_and_keeps_the_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", max_entries=10, evict_every=5)
+    for i in range(10):
+        cache.put(f"k{i}", f"reply {i}")
+    assert cache.get("k0") == "reply 0"
+    for i in range(10, 14):
+        cache.put(f"k{i}", f"reply {i}")
+    # No eviction yet: at most `evict_every` puts past the limit
+    assert cache.stats()["size"] == 14
+
+    cache.put("k14", "reply 14")
+    assert cache.stats()["size"] == 10
+    assert cache.get("k0") == "reply 0"
+    assert cache.get("k1") is None
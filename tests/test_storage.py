@@ -0,0 +1,48 @@
+import json
+import threading
+
+from storage import Storage
+
+
+def test_concurrent_json_migrations_import_once(tmp_path):
+    legacy = tmp_path / "memories.json"
+    legacy.write_text(json.dumps([{"id": i, "title": f"Memory {i}", "date": "2024-01-01"} for i in range(1, 51)]))
+    storages = [Storage(tmp_path / "twin.sqlite3") for _ in range(4)]
+    start = threading.Barrier(len(storages))
+    imported = []
+
+    def migrate(storage):
+        start.wait()
+        imported.append(storage.migrate_json("memories", legacy))
+
+    threads = [threading.Thread(target=migrate, args=(storage,)) for storage in storages]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(imported)[-1] == 50 and sum(imported) == 50
+    assert len(storages[0].all("memories")) == 50
+    assert not legacy.exists() and (tmp_path / "memories.json.migrated").exists()
+
+    # A restored legacy file is not imported again
+    legacy.write_text((tmp_path / "memories.json.migrated").read_text())
+    assert storages[0].migrate_json("memories", legacy) == 0
+    assert len(storages[0].all("memories")) == 50
+
+
+def test_pages_walk_every_entry_including_ones_without_a_date(tmp_path):
+    storage = Storage(tmp_path / "twin.sqlite3")
+    dates = ["2024-03-01", None, "2024-01-15", "2024-03-01", None, "2023-12-31", "2024-01-15", None]
+    ids = [storage.add("memories", {"title": f"Memory {i}", "date": date})["id"] for i, date in enumerate(dates * 3)]
+
+    seen, cursor = [], None
+    while True:
+        entries, cursor = storage.page("memories", limit=4, cursor=cursor)
+        seen += [entry["id"] for entry in entries]
+        if cursor is None:
+            break
+
+    expected = sorted(ids, key=lambda entry_id: ((dates * 3)[ids.index(entry_id)] or "", entry_id), reverse=True)
+    assert seen == expected
+    assert storage.count("memories") == len(ids)
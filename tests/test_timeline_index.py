@@ -0,0 +1,132 @@
+import random
+
+import pytest
+
+from timeline_index import TimelineIndex
+
+CATEGORIES = ["Travel", "Romantic", "Other"]
+MOODS = ["😊", "🥰", "😢"]
+WORDS = ["beach", "pie", "apple", "mountain", "lake", "Paris", "rain", "picnic", "dance"]
+
+
+def make_entries(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "title": " ".join(rng.sample(WORDS, 2)),
+            "description": " ".join(rng.choices(WORDS, k=4)),
+            "category": rng.choice(CATEGORIES),
+            "mood": rng.choice(MOODS),
+            # Shared and missing dates exercise the (date, id) order
+            "date": rng.choice([None, "2023-05-01", "2024-01-15", f"2024-02-{rng.randint(1, 28):02d}"]),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def brute_force(entries, text=None, filters=None):
+    """Matching entries, newest first, without the index."""
+    text = (text or "").lower()
+    matches = []
+    for entry in entries:
+        if text not in f"{entry['title']}\n{entry['description']}".lower():
+            continue
+        if any(entry.get(facet) not in (values if isinstance(values, list) else [values])
+               for facet, values in (filters or {}).items()):
+            continue
+        matches.append(entry)
+    return sorted(matches, key=lambda entry: ((entry["date"] or "").replace("-", ""), entry["id"]), reverse=True)
+
+
+QUERIES = [
+    (None, None),
+    ("", {"category": "Travel"}),
+    ("p", None),  # shorter than a trigram
+    ("ie", {"mood": ["😊", "🥰"]}),
+    ("pie", None),  # exactly one trigram
+    ("apple pie", None),
+    ("PARIS", {"category": ["Travel", "Romantic"], "mood": "😢"}),
+    ("lake rain", {"category": "Other"}),
+    ("nowhere", None),
+    ("beach", {"category": "Unknown"}),
+]
+
+
+@pytest.mark.parametrize("text, filters", QUERIES)
+def test_matches_and_count_agree_with_a_full_scan(text, filters):
+    entries = make_entries(300)
+    index = TimelineIndex()
+    index.rebuild(entries)
+
+    expected = brute_force(entries, text, filters)
+    assert index.matches(text, filters) == expected
+    assert index.count(text, filters) == len(expected)
+
+
+@pytest.mark.parametrize("text, filters", QUERIES)
+def test_cursor_pages_walk_every_match_in_order(text, filters):
+    entries = make_entries(300)
+    index = TimelineIndex()
+    index.rebuild(entries)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor, total = index.search(text, filters, limit=7, cursor=cursor)
+        assert len(page) <= 7
+        seen += page
+        if cursor is None:
+            break
+
+    expected = brute_force(entries, text, filters)
+    assert seen == expected
+    assert total == len(expected)
+
+
+def test_removals_and_edits_through_a_rebuild_keep_results_exact():
+    entries = {entry["id"]: entry for entry in make_entries(200, seed=1)}
+    index = TimelineIndex()
+    index.rebuild(list(entries.values()), version=0)
+    rng = random.Random(2)
+
+    version = 0
+    for entry_id in rng.sample(sorted(entries), 150):
+        version += 1
+        if rng.random() < 0.2:
+            edited = dict(entries[entry_id], title="Edited picnic", category="Romantic")
+            entries[entry_id] = edited
+            index.add(edited, version)
+        else:
+            del entries[entry_id]
+            index.remove(entry_id, version)
+
+    # Dead slots outnumbered live ones at some point, so the index was rebuilt with fewer slots
+    assert index._n < 200
+    assert index.version == version
+    assert len(index) == len(entries)
+    for text, filters in QUERIES + [("edited picnic", {"category": "Romantic"})]:
+        assert index.matches(text, filters) == brute_force(list(entries.values()), text, filters)
+    assert index.facet_values("category") == sorted({entry["category"] for entry in entries.values()})
+
+
+def test_unknown_facet_is_rejected():
+    index = TimelineIndex()
+    index.rebuild(make_entries(5))
+    with pytest.raises(ValueError):
+        index.count("pie", {"colour": "red"})
+
+
+def test_sync_follows_storage_versions(tmp_path):
+    from storage import Storage
+
+    storage = Storage(tmp_path / "twin.sqlite3")
+    for entry in make_entries(10):
+        storage.add("memories", {key: value for key, value in entry.items() if key != "id"})
+    index = TimelineIndex()
+    index.sync(storage)
+    assert len(index) == 10
+
+    added = storage.add("memories", {"title": "Midnight dance", "date": "2024-03-01", "category": "Other"})
+    index.add(added, storage.version("memories"))
+    assert index.version == storage.version("memories")
+    assert index.matches("midnight") == [added]
@@ -0,0 +1,175 @@
+import os
+
+from vector_store import SimpleTextSearch
+
+
+def write(path, text):
+    path.write_text(text)
+    # Make the edit visible to stat-based change detection even on coarse clocks
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_edited_file_is_reindexed_instead_of_read_at_stale_offsets(tmp_path):
+    write(tmp_path / "a.txt", "Granny baked apple pie every Sunday.")
+    write(tmp_path / "b.txt", "We hiked the mountain trail in spring.")
+    search = SimpleTextSearch(str(tmp_path), use_snapshot=False)
+
+    write(tmp_path / "a.txt", "Preface. " * 20 + "Granny baked apple pie every Sunday.")
+    results = search.search("apple pie")
+
+    assert results[0]["content"].endswith("Granny baked apple pie every Sunday.")
+    assert results[0]["source"] == "a.txt"
+
+
+def test_touched_file_keeps_its_chunks(tmp_path):
+    write(tmp_path / "a.txt", "Granny baked apple pie every Sunday.")
+    search = SimpleTextSearch(str(tmp_path), use_snapshot=False)
+    segments = search._state.segments
+
+    write(tmp_path / "a.txt", "Granny baked apple pie every Sunday.")
+    assert search.refresh() == {"added": [], "changed": [], "removed": []}
+    assert search._state.segments is segments
+    assert search.search("apple")[0]["content"] == "Granny baked apple pie every Sunday."
+
+
+def test_dense_search_after_deleted_file_is_refreshed(tmp_path):
+    write(tmp_path / "a.txt", "Granny baked apple pie every Sunday.")
+    write(tmp_path / "b.txt", "We hiked the mountain trail in spring.")
+    search = SimpleTextSearch(str(tmp_path), use_snapshot=False)
+
+    (tmp_path / "a.txt").unlink()
+    assert search.refresh()["removed"] == [(tmp_path / "a.txt").as_posix()]
+
+    for mode in ("dense", "hybrid"):
+        results = search.search("mountain hike", mode=mode)
+        assert [doc["source"] for doc in results] == ["b.txt"]
+
+
+def test_dense_mode_encodes_segments_while_building(tmp_path):
+    write(tmp_path / "a.txt", "Granny baked apple pie every Sunday.")
+    write(tmp_path / "b.txt", "We hiked the mountain trail in spring.")
+    search = SimpleTextSearch(str(tmp_path), use_snapshot=False, mode="dense")
+    assert len(search._state.segments[0].vectors) == 2
+
+    (tmp_path / "a.txt").unlink()
+    search.refresh()
+    assert [doc["source"] for doc in search.search("mountains")] == ["b.txt"]
+
+
+def memory(i, text=None):
+    return {"id": i, "text": text or f"memory {i} about topic{i % 50} and place{i % 7}", "date": f"2020-01-{i % 28 + 1:02d}"}
+
+
+def test_merges_leave_large_segments_alone(monkeypatch):
+    import vector_store
+
+    merged_sizes = []
+    merge = vector_store._Segment.merge.__func__
+
+    def recording_merge(cls, parts, dim):
+        merged_sizes.append(sum(len(seg.documents) for seg, *_ in parts))
+        return merge(cls, parts, dim)
+
+    monkeypatch.setattr(vector_store._Segment, "merge", classmethod(recording_merge))
+    search = SimpleTextSearch(None)
+    search.sync_records("memory", [memory(i) for i in range(5000)])
+    base = search._state.segments[0]
+
+    updates = 400
+    for i in range(5000, 5000 + updates):
+        search.update_records("memory", [memory(i)])
+        assert base in search._state.segments
+        assert len(search._state.segments) <= search.max_segments
+
+    # Merges only ever touch the small segments added since the sync
+    assert merged_sizes and max(merged_sizes) <= updates
+    assert sum(merged_sizes) < 10 * updates
+    assert len(search.documents) == 5000 + updates
+
+
+def test_merged_index_matches_a_fresh_one():
+    search = SimpleTextSearch(None)
+    records = {i: memory(i) for i in range(200)}
+    search.sync_records("memory", list(records.values()))
+    for i in range(200, 260):
+        new, edited = memory(i), memory(i - 100, f"edited memory {i} topic{i % 50}")
+        search.update_records("memory", [new, edited], removed=[i - 150])
+        records.update({i: new, i - 100: edited})
+        records.pop(i - 150, None)
+    expected = SimpleTextSearch(None)
+    expected.sync_records("memory", list(records.values()))
+
+    for query in ("topic3", "edited topic7", "memory 250", "place2 topic11"):
+        for filters in (None, {"date_from": "2020-01-05", "date_to": "2020-01-09"}):
+            assert (sorted(doc["content"] for doc in search.search(query, 1000, filters=filters))
+                    == sorted(doc["content"] for doc in expected.search(query, 1000, filters=filters)))
+
+
+def test_refresh_writes_the_snapshot_back(tmp_path, monkeypatch):
+    import vector_store
+
+    write(tmp_path / "a.txt", "Granny baked apple pie every Sunday.")
+    write(tmp_path / "b.txt", "We hiked the mountain trail in spring.")
+    SimpleTextSearch(str(tmp_path))
+    write(tmp_path / "c.txt", "The lake froze over in winter.")
+    (tmp_path / "b.txt").unlink()
+    search = SimpleTextSearch(str(tmp_path))
+    search.wait_for_snapshot()
+
+    # The next start opens the rewritten snapshot without reading any file
+    monkeypatch.setattr(vector_store._Segment, "build", None)
+    restarted = SimpleTextSearch(str(tmp_path))
+    assert isinstance(restarted._state.segments[0], vector_store.IndexSnapshot)
+    assert sorted(doc["source"] for doc in restarted.documents) == ["a.txt", "c.txt"]
+    assert restarted.search("winter lake")[0]["content"] == "The lake froze over in winter."
+    assert ([score for score, _ in restarted.search_scored("apple winter", 5)]
+            == [score for score, _ in search.search_scored("apple winter", 5)])
+
+
+def test_context_cache_hits_across_token_budgets(tmp_path):
+    write(tmp_path / "a.txt", "Granny baked apple pie every Sunday. " * 40)
+    write(tmp_path / "b.txt", "We hiked the mountain trail in spring. " * 40)
+    search = SimpleTextSearch(str(tmp_path), use_snapshot=False)
+
+    contexts = [search.get_context("apple pie", token_budget=budget) for budget in (400, 300, 200, 100)]
+
+    assert search.cache_stats()["misses"] == 1
+    assert search.cache_stats()["hits"] == 3
+    assert [len(context) for context in contexts] == sorted((len(context) for context in contexts), reverse=True)
+    assert contexts[-1] == search.get_context("pie apple", token_budget=100)
+
+
+def test_dense_context_cache_tells_repeated_terms_apart(tmp_path):
+    write(tmp_path / "a.txt", "Paris in the spring, Paris at night, Paris by the river.")
+    write(tmp_path / "b.txt", "Our dog loves the park; the dog chases every dog it sees.")
+    write(tmp_path / "c.txt", "We walked the dog through Paris.")
+    for mode in ("dense", "hybrid"):
+        search = SimpleTextSearch(str(tmp_path), use_snapshot=False, mode=mode)
+        first = search.get_context("paris paris dog", k=2)
+        second = search.get_context("paris dog dog", k=2)
+
+        uncached = SimpleTextSearch(str(tmp_path), use_snapshot=False, mode=mode)
+
+        assert first != second
+        assert second == uncached.get_context("paris dog dog", k=2)
+        assert search.cache_stats()["misses"] == 2
+
+
+def test_a_burst_of_refreshes_rewrites_the_snapshot_once(tmp_path, monkeypatch):
+    write(tmp_path / "a.txt", "Granny baked apple pie every Sunday.")
+    search = SimpleTextSearch(str(tmp_path))
+    writes = []
+    save_snapshot = search._save_snapshot
+    monkeypatch.setattr(search, "_save_snapshot", lambda *args: writes.append(save_snapshot(*args)))
+    search.snapshot_delay = 0.2
+
+    for i in range(5):
+        write(tmp_path / f"new{i}.txt", f"Note number {i} about the lake.")
+        search.refresh()
+    assert writes == []
+
+    search.wait_for_snapshot()
+    assert len(writes) == 1
+    restarted = SimpleTextSearch(str(tmp_path))
+    assert sorted(doc["source"] for doc in restarted.documents) == ["a.txt"] + [f"new{i}.txt" for i in range(5)]
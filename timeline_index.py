@@ -0,0 +1,239 @@
+"""
+In-memory search index over the memory timeline.
+
+The timeline's search box matches substrings of titles and descriptions,
+and its filters select categories and moods. Instead of scanning every
+memory per keystroke, `TimelineIndex` keeps:
+
+- a trigram index: for every 3-character sequence of the lower-cased text,
+  the slots of the entries containing it (compact append-only arrays). A
+  query intersects the postings of its trigrams, rarest first, and only the
+  few surviving candidates are checked for the exact substring;
+- one boolean mask per category and per mood (facets) plus a live mask,
+  combined with numpy before the postings are intersected;
+- a sort key per slot (date, then id), so the matches are ordered newest
+  first - and the top `limit` of a page picked - without sorting them all.
+
+Entries are added and removed incrementally as memories are saved: a
+removed entry's slot is just marked dead, and the index is rebuilt once
+dead slots outnumber live ones. Queries shorter than three characters have
+no trigrams and fall back to checking the facet-filtered entries.
+"""
+import threading
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+_ID_BITS = 32
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _sort_key(date, entry_id):
+    """Integer ordering entries by (date, id); dates are YYYY-MM-DD strings."""
+    try:
+        day = int(str(date).replace("-", "")) if date else 0
+    except ValueError:
+        day = 0
+    return (day << _ID_BITS) | int(entry_id)
+
+
+class TimelineIndex:
+    """Substring + facet index of one storage collection; thread-safe.
+
+    `version` is the storage version the index reflects (see `sync`), or
+    None once it may be out of date.
+    """
+
+    def __init__(self, text_fields=("title", "description"), facets=("category", "mood"), order="date"):
+        self.text_fields = text_fields
+        self.facets = facets
+        self.order = order
+        self.version = None
+        self._lock = threading.Lock()
+        self._reset(0)
+
+    def _reset(self, capacity):
+        capacity = max(capacity, 64)
+        self._n = 0
+        self._dead = 0
+        self._entries = []  # slot -> entry
+        self._texts = []  # slot -> lower-cased searchable text
+        self._slots = {}  # entry id -> live slot
+        self._keys = np.zeros(capacity, dtype=np.int64)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._facet_masks = {facet: {} for facet in self.facets}  # facet -> value -> mask
+        self._postings = defaultdict(lambda: array("I"))  # trigram -> slots
+
+    def sync(self, storage, collection="memories"):
+        """Rebuild from `storage` if it changed since the index last matched it."""
+        if storage.version(collection) == self.version:
+            return
+        version, entries = storage.versioned_snapshot(collection)
+        self.rebuild(entries, version)
+
+    def rebuild(self, entries, version=None):
+        with self._lock:
+            self._reset(len(entries) * 2)
+            for entry in entries:
+                self._add(entry)
+            self.version = version
+
+    def add(self, entry, version=None):
+        """Index a new (or replace an edited) entry; `version` is the storage version after the write."""
+        with self._lock:
+            self._remove(entry["id"])
+            self._add(entry)
+            self._advance(version)
+
+    def remove(self, entry_id, version=None):
+        with self._lock:
+            self._remove(entry_id)
+            self._advance(version)
+            if self._dead > self._n - self._dead:
+                entries = [self._entries[slot] for slot in self._slots.values()]
+                version = self.version
+                self._reset(len(entries) * 2)
+                for entry in sorted(entries, key=lambda entry: entry["id"]):
+                    self._add(entry)
+                self.version = version
+
+    def _advance(self, version):
+        # Only one write ahead of the index means no other writer interleaved
+        if self.version is None or version is None or version != self.version + 1:
+            self.version = None
+        else:
+            self.version = version
+
+    def _add(self, entry):
+        slot = self._n
+        if slot == len(self._keys):
+            self._grow(2 * len(self._keys))
+        self._n += 1
+        self._entries.append(entry)
+        text = "\n".join(str(entry.get(field) or "") for field in self.text_fields).lower()
+        self._texts.append(text)
+        self._slots[entry["id"]] = slot
+        self._keys[slot] = _sort_key(entry.get(self.order), entry["id"])
+        self._live[slot] = True
+        for facet, masks in self._facet_masks.items():
+            value = entry.get(facet)
+            mask = masks.get(value)
+            if mask is None:
+                mask = masks[value] = np.zeros(len(self._keys), dtype=bool)
+            mask[slot] = True
+        for trigram in _trigrams(text):
+            self._postings[trigram].append(slot)
+
+    def _remove(self, entry_id):
+        slot = self._slots.pop(entry_id, None)
+        if slot is None:
+            return
+        self._live[slot] = False
+        entry = self._entries[slot]
+        for facet, masks in self._facet_masks.items():
+            masks[entry.get(facet)][slot] = False
+        self._dead += 1
+
+    def _grow(self, capacity):
+        def grown(old):
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            return new
+
+        self._keys = grown(self._keys)
+        self._live = grown(self._live)
+        for masks in self._facet_masks.values():
+            for value in masks:
+                masks[value] = grown(masks[value])
+
+    def facet_values(self, facet):
+        """Values of `facet` that live entries have."""
+        with self._lock:
+            return sorted(
+                (value for value, mask in self._facet_masks[facet].items() if value is not None and mask[:self._n].any()),
+                key=str,
+            )
+
+    def _match(self, text, filters):
+        """Slots of live entries containing `text` and passing `filters` ({facet: value or list})."""
+        n = self._n
+        mask = self._live[:n].copy()
+        for facet, values in (filters or {}).items():
+            if facet not in self._facet_masks:
+                raise ValueError(f"Unknown facet {facet!r}; expected one of {self.facets}")
+            values = values if isinstance(values, (list, tuple, set, frozenset)) else [values]
+            allowed = np.zeros(n, dtype=bool)
+            for value in values:
+                facet_mask = self._facet_masks[facet].get(value)
+                if facet_mask is not None:
+                    allowed |= facet_mask[:n]
+            mask &= allowed
+
+        text = (text or "").lower()
+        if not text:
+            return np.flatnonzero(mask)
+        trigrams = _trigrams(text)
+        if not trigrams:
+            candidates = np.flatnonzero(mask)
+        else:
+            postings = []
+            for trigram in trigrams:
+                posting = self._postings.get(trigram)
+                if not posting:
+                    return np.zeros(0, dtype=np.int64)
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = np.frombuffer(postings[0], dtype=np.uint32).astype(np.int64)
+            candidates = candidates[mask[candidates]]
+            for posting in postings[1:]:
+                if not len(candidates):
+                    break
+                candidates = candidates[np.isin(candidates, np.frombuffer(posting, dtype=np.uint32),
+                                                assume_unique=True)]
+        if len(text) == 3:
+            return candidates  # the one trigram is the query itself
+        # Trigrams may all occur without forming the substring: check the survivors
+        texts = self._texts
+        return np.array([slot for slot in candidates.tolist() if text in texts[slot]], dtype=np.int64)
+
+    def search(self, text=None, filters=None, limit=20, cursor=None):
+        """One page of matches, newest first; cursors work like `Storage.page`.
+
+        Returns (tuple of entries, next cursor or None, number of matches).
+        """
+        with self._lock:
+            slots = self._match(text, filters)
+            total = len(slots)
+            keys = self._keys[slots]
+            if cursor:
+                after = keys < _sort_key(cursor[0], cursor[1])
+                slots, keys = slots[after], keys[after]
+            if len(slots) > limit:
+                top = np.argpartition(-keys, limit)[:limit]
+                more = True
+            else:
+                top = np.arange(len(slots))
+                more = False
+            top = top[np.argsort(-keys[top], kind="stable")]
+            entries = tuple(self._entries[slot] for slot in slots[top].tolist())
+        next_cursor = (entries[-1][self.order], entries[-1]["id"]) if more else None
+        return entries, next_cursor, total
+
+    def count(self, text=None, filters=None):
+        with self._lock:
+            return len(self._match(text, filters))
+
+    def matches(self, text=None, filters=None):
+        """Every matching entry, newest first."""
+        with self._lock:
+            slots = self._match(text, filters)
+            slots = slots[np.argsort(-self._keys[slots], kind="stable")]
+            return [self._entries[slot] for slot in slots.tolist()]
+
+    def __len__(self):
+        with self._lock:
+            return self._n - self._dead
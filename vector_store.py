@@ -1,77 +1,1120 @@
+import bisect
+import hashlib
+import heapq
+import json
+import math
 import os
+import re
+import threading
+import time
+import weakref
+import zlib
+from array import array
+from collections import Counter, OrderedDict, defaultdict
 from pathlib import Path
 
+import numpy as np
+
+from batch_search import BM25Matrix
+from chunker import ChunkSpans, StaleChunkError, file_stamp, iter_file_chunks, split_text
+from context_packing import pack_context
+from dense_vectors import HashedNgramEncoder, QuantizedVectors
+from index_snapshot import IndexSnapshot, write_snapshot
+from metrics import timed
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _tokenize(text):
+    """Lowercase word tokens - whole words only, so "art" never matches "heart"."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class _RecordMeta:
+    """Metadata indexes of a record segment: source/category postings and a date-sorted list."""
+
+    def __init__(self, documents):
+        self.sources = defaultdict(set)
+        self.categories = defaultdict(set)
+        dated = []
+        for doc_id, doc in enumerate(documents):
+            self.sources[doc["source"]].add(doc_id)
+            if doc.get("category") is not None:
+                self.categories[doc["category"]].add(doc_id)
+            if doc.get("date"):
+                dated.append((doc["date"], doc_id))
+        dated.sort()
+        self.dates = [date for date, _ in dated]
+        self.dated_ids = [doc_id for _, doc_id in dated]
+
+    def select(self, filters):
+        """Doc ids passing `filters`, or None when no filter applies."""
+        selected = None
+        for field, index in (("source", self.sources), ("category", self.categories)):
+            if field in filters:
+                ids = set().union(*(index.get(value, ()) for value in _as_set(filters[field])))
+                selected = ids if selected is None else selected & ids
+        if "date_from" in filters or "date_to" in filters:
+            lo = bisect.bisect_left(self.dates, str(filters["date_from"])) if "date_from" in filters else 0
+            hi = bisect.bisect_right(self.dates, str(filters["date_to"])) if "date_to" in filters else len(self.dates)
+            ids = set(self.dated_ids[lo:hi])
+            selected = ids if selected is None else selected & ids
+        return selected
+
+
+def _query_key(query, mode):
+    """Hashable form of what ranking `query` in `mode` depends on, for cache keys.
+
+    BM25 scores each distinct term once; dense vectors also weigh how often
+    a term is repeated, so other modes keep the counts.
+    """
+    terms = _tokenize(query)
+    if mode == "keyword":
+        return tuple(sorted(set(terms)))
+    return tuple(sorted(Counter(terms).items()))
+
+
+def _freeze(filters):
+    """Hashable form of a filters dict, for cache keys."""
+    if not filters:
+        return None
+    return tuple(sorted((field, tuple(sorted(_as_set(value), key=str))) for field, value in filters.items()))
+
+
+def _as_set(value):
+    return set(value) if isinstance(value, (list, tuple, set, frozenset)) else {value}
+
+
+def _filter_docs(seg, filters):
+    """Doc ids of `seg` that pass `filters`; None means every doc passes.
+
+    Filters are {"source", "category", "date_from", "date_to"}; source and
+    category take one value or a list. Knowledge-base chunks only carry a
+    source (their file name), so date or category filters exclude them.
+    """
+    meta = getattr(seg, "meta", None)
+    if meta is not None:
+        return meta.select(filters)
+    if "category" in filters or "date_from" in filters or "date_to" in filters:
+        return frozenset()
+    if "source" not in filters:
+        return None
+    sources = _as_set(filters["source"])
+    ids = set()
+    for path, (start, end, _, _) in seg.files.items():
+        if Path(path).name in sources:
+            ids.update(range(start, end))
+    return ids
+
+
+def _quantized(rows, dim):
+    """QuantizedVectors of a list of float vectors."""
+    return QuantizedVectors.quantize(np.vstack(rows) if rows else np.zeros((0, dim), dtype=np.float32))
+
+
+class _Segment:
+    """Immutable chunk store + postings for knowledge-base files or app records.
+
+    `files` maps each file path - and `records` each record key - to (first doc
+    id, end doc id, total tokens, fingerprint) so an entry's chunks can be
+    retired without touching the rest of the segment. Record segments also
+    carry `meta` for metadata filters. `vectors` holds the dense vectors of
+    every chunk when the segment was built with an encoder, else None.
+    """
+
+    def __init__(self, documents, postings, doc_lengths, files, records=None, meta=None, vectors=None):
+        self.documents = documents
+        self.postings = postings  # term -> list of (doc_id, term frequency)
+        self.doc_lengths = doc_lengths
+        self.files = files
+        self.records = records or {}
+        self.meta = meta
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, file_chunks, encoder=None):
+        """Index an iterable of (path, chunks, digest) tuples.
+
+        `chunks` yields (offset, length, text) spans and is consumed lazily;
+        `digest()` returns the file's sha1 once its chunks have been read.
+        Chunk text is tokenized and dropped - only the spans are kept, stamped
+        with the file's size and mtime from before it was read. With an
+        `encoder`, dense vectors are computed while the text is at hand.
+        """
+        documents = ChunkSpans()
+        postings = defaultdict(list)
+        doc_lengths = array("I")
+        files = {}
+        rows = []
+        for path, chunks, digest in file_chunks:
+            source = Path(path).name
+            start = len(documents)
+            total = 0
+            try:
+                stamp = file_stamp(path)
+            except OSError:
+                stamp = None  # unreadable: it yields no chunks
+            for offset, length, text in chunks:
+                tokens = _tokenize(text)
+                term_counts = Counter(tokens)
+                doc_id = len(documents)
+                for term, tf in term_counts.items():
+                    postings[term].append((doc_id, tf))
+                documents.append(path, source, offset, length, stamp)
+                if encoder is not None:
+                    rows.append(encoder.encode_tokens(tokens))
+                n_tokens = sum(term_counts.values())
+                doc_lengths.append(n_tokens)
+                total += n_tokens
+            files[path] = (start, len(documents), total, digest())
+        vectors = _quantized(rows, encoder.dim) if encoder is not None else None
+        return cls(documents, dict(postings), doc_lengths, files, vectors=vectors)
+
+    @classmethod
+    def build_records(cls, entries, encoder=None):
+        """Index an iterable of (record key, chunk docs, fingerprint) tuples.
+
+        Record text is small and lives in app storage, so chunk docs (with their
+        metadata) are kept in memory rather than as file spans.
+        """
+        documents = []
+        postings = defaultdict(list)
+        doc_lengths = array("I")
+        records = {}
+        rows = []
+        for key, docs, fingerprint in entries:
+            start = len(documents)
+            total = 0
+            for doc in docs:
+                tokens = _tokenize(doc["content"])
+                term_counts = Counter(tokens)
+                doc_id = len(documents)
+                for term, tf in term_counts.items():
+                    postings[term].append((doc_id, tf))
+                documents.append(doc)
+                if encoder is not None:
+                    rows.append(encoder.encode_tokens(tokens))
+                n_tokens = sum(term_counts.values())
+                doc_lengths.append(n_tokens)
+                total += n_tokens
+            records[key] = (start, len(documents), total, fingerprint)
+        vectors = _quantized(rows, encoder.dim) if encoder is not None else None
+        return cls(documents, dict(postings), doc_lengths, {}, records, _RecordMeta(documents), vectors)
+
+    @classmethod
+    def merge(cls, parts, dim):
+        """Concatenate the live entries of segments of one kind (file or record) into one segment.
+
+        `parts` lists (segment, live paths, live record keys, vectors or None).
+        Postings are renumbered rather than rebuilt: no chunk text is re-read
+        or re-tokenized, and spans keep the stamps their files were indexed
+        under.
+        """
+        spans = isinstance(parts[0][0].documents, ChunkSpans)
+        documents = ChunkSpans() if spans else []
+        postings = defaultdict(list)
+        doc_lengths = array("I")
+        files, records = {}, {}
+        rows = [] if all(vectors is not None for *_, vectors in parts) else None
+        for seg, paths, keys, vectors in parts:
+            entries = [(seg.files[path], files, path) for path in paths]
+            entries += [(seg.records[key], records, key) for key in keys]
+            remap = {}  # old doc id -> new doc id, in new order
+            for (start, end, total, fingerprint), target, key in sorted(entries, key=lambda entry: entry[0][0]):
+                new_start = len(documents)
+                for doc_id in range(start, end):
+                    remap[doc_id] = len(documents)
+                    if spans:
+                        path, offset, length = seg.documents.span(doc_id)
+                        documents.append(path, Path(path).name, offset, length, seg.documents.stamp(doc_id))
+                    else:
+                        documents.append(seg.documents[doc_id])
+                    doc_lengths.append(seg.doc_lengths[doc_id])
+                target[key] = (new_start, len(documents), total, fingerprint)
+            for term, term_postings in seg.postings.items():
+                live = [(remap[doc_id], tf) for doc_id, tf in term_postings if doc_id in remap]
+                if live:
+                    postings[term].extend(live)
+            if rows is not None:
+                rows.append((vectors, np.fromiter(remap, dtype=np.int64, count=len(remap))))
+        vectors = QuantizedVectors.concatenate(rows, dim) if rows is not None else None
+        meta = None if spans else _RecordMeta(documents)
+        return cls(documents, dict(postings), doc_lengths, files, records, meta, vectors)
+
+    def csr_postings(self):
+        """Return (terms, indptr, doc_ids, tfs) with postings laid out term by term."""
+        terms = list(self.postings)
+        indptr = array("Q", [0])
+        doc_ids = array("I")
+        tfs = array("I")
+        for term in terms:
+            for doc_id, tf in self.postings[term]:
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+            indptr.append(len(doc_ids))
+        return terms, indptr, doc_ids, tfs
+
+
+class _IndexState:
+    """One immutable generation of the index; searches read a single state.
+
+    `files` maps path -> (segment index, size, mtime_ns) for every live file,
+    `records` maps record key -> (segment index, fingerprint) for every live
+    app record and `dead` holds, per segment, the doc ids retired by later
+    updates. `version` goes up whenever the indexed content changes.
+    """
+
+    def __init__(self, segments, dead, files, n_docs, total_length, version=0, records=None):
+        self.segments = segments
+        self.dead = dead
+        self.files = files
+        self.records = records or {}
+        self.n_docs = n_docs
+        self.total_length = total_length
+        self.version = version
+
+
+_MISSING = object()
+
+
+class _LRUCache:
+    """Small thread-safe LRU map with hit/miss/eviction counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+class _SnapshotView:
+    """The live knowledge-base chunks of one index generation, laid out as a single segment.
+
+    Record segments are left out: records come from app storage and are
+    synced again on start. Used to rewrite the snapshot after a refresh.
+    """
+
+    def __init__(self, state):
+        self._parts = []  # (segment, live doc ids)
+        self.files = {}
+        self.doc_lengths = array("I")
+        for seg_idx, seg in enumerate(state.segments):
+            live = sorted(
+                ((span, path) for path, span in seg.files.items() if state.files.get(path, (None,))[0] == seg_idx),
+                key=lambda item: item[0][0],
+            )
+            doc_ids = []
+            for (start, end, total, sha1), path in live:
+                self.files[path] = (len(self.doc_lengths), len(self.doc_lengths) + end - start, total, sha1)
+                doc_ids.extend(range(start, end))
+                self.doc_lengths.extend(seg.doc_lengths[doc_id] for doc_id in range(start, end))
+            if doc_ids:
+                self._parts.append((seg, np.array(doc_ids, dtype=np.int64)))
+
+    @property
+    def documents(self):
+        for seg, doc_ids in self._parts:
+            if isinstance(seg.documents, ChunkSpans):
+                yield from seg.documents.read(doc_ids.tolist())
+            else:
+                for doc_id in doc_ids.tolist():
+                    yield seg.documents[doc_id]
+
+    def csr_postings(self):
+        """Return (terms, indptr, doc_ids, tfs) of the live chunks, renumbered in order."""
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        offset = 0
+        for seg, live in self._parts:
+            new_id = np.full(len(seg.documents), -1, dtype=np.int64)
+            new_id[live] = np.arange(offset, offset + len(live))
+            offset += len(live)
+            terms, indptr, docs, freqs = seg.csr_postings()
+            local_terms = np.fromiter((vocab.setdefault(term, len(vocab)) for term in terms),
+                                      dtype=np.int64, count=len(terms))
+            docs = new_id[np.asarray(docs, dtype=np.int64)]
+            keep = docs >= 0
+            term_ids.append(np.repeat(local_terms, np.diff(np.asarray(indptr, dtype=np.int64)))[keep])
+            doc_ids.append(docs[keep])
+            tfs.append(np.asarray(freqs, dtype=np.int64)[keep])
+        if not term_ids:
+            return [], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        term_ids, doc_ids, tfs = np.concatenate(term_ids), np.concatenate(doc_ids), np.concatenate(tfs)
+        # Drop terms that only retired chunks had
+        counts = np.bincount(term_ids, minlength=len(vocab))
+        used = np.flatnonzero(counts)
+        renumber = np.zeros(len(vocab), dtype=np.int64)
+        renumber[used] = np.arange(len(used))
+        term_ids = renumber[term_ids]
+        terms = list(vocab)
+        order = np.lexsort((doc_ids, term_ids))
+        indptr = np.concatenate(([0], np.cumsum(counts[used])))
+        return [terms[i] for i in used.tolist()], indptr, doc_ids[order], tfs[order]
+
+
+class _DenseIndex:
+    """Quantized vectors for the live chunks of one index generation."""
+
+    def __init__(self, state, vectors, seg_of_row, doc_of_row, row_of_doc):
+        self.state = state
+        self.vectors = vectors
+        self.seg_of_row = seg_of_row
+        self.doc_of_row = doc_of_row
+        self.row_of_doc = row_of_doc  # per segment: doc id -> row, -1 if retired
+
 
 class SimpleTextSearch:
-    """Simple text search using TF-IDF style matching - no transformers needed."""
+    """Simple text search using BM25 over an inverted index - no transformers needed.
+
+    `mode` picks the retrieval strategy: "keyword" (BM25), "dense" (hashed
+    character n-gram vectors, see dense_vectors) or "hybrid" (both, fused).
+    Search and context packing times are recorded as `metrics_prefix` +
+    "search_seconds" / "context_pack_seconds", so indexes other than the
+    knowledge base can keep out of its stage histograms.
+    """
+
+    MODES = ("keyword", "dense", "hybrid")
+
+    # BM25 parameters
+    k1 = 1.5
+    b = 0.75
+
+    # Chunking parameters
+    chunk_size = 500
+    overlap = 50
+
+    # Refreshes and record updates add small segments; merge some once there are more than this many
+    max_segments = 16
 
-    def __init__(self, knowledge_base_path="knowledge_base"):
+    # Hybrid mode: weight of the dense score, and candidates taken per retriever
+    hybrid_weight = 0.5
+    hybrid_candidates = 20
+
+    # Approximate token budget of the context built by get_context
+    context_token_budget = 400
+
+    # A refresh's snapshot rewrite waits for this many quiet seconds (but no
+    # longer than snapshot_max_delay), so a burst of refreshes costs one rewrite
+    snapshot_delay = 5.0
+    snapshot_max_delay = 60.0
+
+    def __init__(self, knowledge_base_path="knowledge_base", use_snapshot=True, snapshot_path=None,
+                 cache_size=256, mode="keyword", dense_dim=128, shard=None, metrics_prefix=""):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; expected one of {self.MODES}")
         self.knowledge_base_path = knowledge_base_path
-        self.documents = []
+        self.mode = mode
+        self.metrics_prefix = metrics_prefix
+        # (index, count): only index files whose path hashes to this shard
+        self.shard = shard
+        # Without a knowledge base directory the index only holds records (see sync_records)
+        self.use_snapshot = use_snapshot and knowledge_base_path is not None
+        snapshot_name = ".index.snapshot" if shard is None else f".index.shard{shard[0]}of{shard[1]}.snapshot"
+        self.snapshot_path = snapshot_path
+        if snapshot_path is None and knowledge_base_path is not None:
+            self.snapshot_path = os.path.join(knowledge_base_path, snapshot_name)
+        self._state = _IndexState((), (), {}, 0, 0)
+        self._refresh_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_pending = None  # newest state waiting to be written to the snapshot
+        self._snapshot_due = self._snapshot_deadline = 0.0  # monotonic times the write waits for
+        self._snapshot_wake = threading.Event()
+        self._snapshot_writer = None
+        self._matrix = None  # BM25Matrix for search_many, built lazily per generation
+        self._context_cache = _LRUCache(cache_size)
+        self._encoder = HashedNgramEncoder(dim=dense_dim)
+        self._dense = None  # _DenseIndex, built lazily per generation
+        self._segment_vectors = weakref.WeakKeyDictionary()  # segments are immutable
         self._load_documents()
 
+    @property
+    def documents(self):
+        """All live chunks as {"content", "source"} dicts (records also carry metadata)."""
+        def live_documents():
+            state = self._state
+            return [
+                seg.documents[doc_id]
+                for seg, dead in zip(state.segments, state.dead)
+                for doc_id in range(len(seg.documents))
+                if doc_id not in dead
+            ]
+
+        return self._retry_stale(live_documents)
+
+    def _retry_stale(self, read):
+        """Call `read()`; if a knowledge-base file changed since it was indexed, refresh and call it again."""
+        try:
+            return read()
+        except StaleChunkError as e:
+            print(f"{e}: refreshing")
+            self.refresh()
+            return read()
+
+    def _scan_files(self):
+        """Map every .txt path to (size, mtime_ns) - stat only, no file reads."""
+        files = {}
+        if self.knowledge_base_path is None or not Path(self.knowledge_base_path).exists():
+            return files
+        for txt_file in sorted(Path(self.knowledge_base_path).glob("**/*.txt")):
+            path = txt_file.as_posix()
+            if self.shard is not None and zlib.crc32(path.encode("utf-8")) % self.shard[1] != self.shard[0]:
+                continue
+            stat = txt_file.stat()
+            files[path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def _manifest(self, files):
+        return {
+            "files": [[path, size, mtime] for path, (size, mtime) in sorted(files.items())],
+            "params": [self.chunk_size, self.overlap],
+        }
+
     def _load_documents(self):
         """Load all .txt files from the knowledge base directory."""
+        if self.knowledge_base_path is not None:
+            self._load_files()
+
+    @timed("kb_load_seconds")
+    def _load_files(self):
         kb_path = Path(self.knowledge_base_path)
         if not kb_path.exists():
             kb_path.mkdir(parents=True, exist_ok=True)
             return
 
-        for txt_file in kb_path.glob("**/*.txt"):
-            try:
-                with open(txt_file, "r", encoding="utf-8") as f:
-                    content = f.read().strip()
-                if content:
-                    # Split into chunks of ~500 chars
-                    chunks = self._split_text(content, chunk_size=500, overlap=50)
-                    for chunk in chunks:
-                        self.documents.append({
-                            "content": chunk,
-                            "source": str(txt_file.name)
-                        })
-            except Exception as e:
-                print(f"Error loading {txt_file}: {e}")
+        files = self._scan_files()
+        manifest = self._manifest(files) if self.use_snapshot else None
+        segment = stale = None
+        if manifest is not None:
+            segment = IndexSnapshot.open(self.snapshot_path, manifest)
+            if segment is None:
+                stale = IndexSnapshot.open(self.snapshot_path)
+                if stale is not None and stale.manifest.get("params") == manifest["params"]:
+                    # Files changed since the snapshot was saved: load it, then re-index just those
+                    segment = stale
+                    files = {path: (size, mtime) for path, size, mtime in stale.manifest["files"]}
+        if segment is None:
+            segment = _Segment.build(self._read_files(files), self._build_encoder)
+            if manifest is not None:
+                self._save_snapshot(manifest, segment)
+
+        self._state = _IndexState(
+            segments=(segment,),
+            dead=(frozenset(),),
+            files={path: (0,) + files[path] for path in segment.files},
+            n_docs=len(segment.documents),
+            total_length=sum(entry[2] for entry in segment.files.values()),
+            version=self._state.version + 1,
+        )
+        if segment is stale:
+            self.refresh()
+
+    def _read_files(self, paths):
+        """Yield (path, chunks, digest) for `_Segment.build`; files are streamed, not read whole."""
+        for path in paths:
+            sha1 = hashlib.sha1()
+            yield path, self._file_chunks(path, sha1), sha1.hexdigest
+
+    def _file_chunks(self, path, digest=None):
+        try:
+            yield from iter_file_chunks(path, self.chunk_size, self.overlap, digest=digest)
+        except Exception as e:
+            print(f"Error loading {path}: {e}")
+
+    def _file_sha1(self, path):
+        sha1 = hashlib.sha1()
+        try:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 16), b""):
+                    sha1.update(block)
+        except OSError as e:
+            print(f"Error loading {path}: {e}")
+            return None
+        return sha1.hexdigest()
+
+    def _save_snapshot(self, manifest, segment):
+        try:
+            write_snapshot(self.snapshot_path, manifest, segment)
+        except Exception as e:
+            print(f"Error saving index snapshot {self.snapshot_path}: {e}")
+
+    def _schedule_snapshot(self, state):
+        """Rewrite the snapshot from `state` in a background thread, so the next start opens it as is.
+
+        The write waits until no newer state was scheduled for
+        `snapshot_delay` seconds (at most `snapshot_max_delay` after the first
+        one), then writes the newest; one writer runs at a time.
+        """
+        if not self.use_snapshot:
+            return
+        now = time.monotonic()
+        with self._snapshot_lock:
+            if self._snapshot_pending is None:
+                self._snapshot_deadline = now + self.snapshot_max_delay
+            self._snapshot_pending = state
+            self._snapshot_due = min(now + self.snapshot_delay, self._snapshot_deadline)
+            if self._snapshot_writer is None:
+                self._snapshot_writer = threading.Thread(target=self._write_snapshots, name="index-snapshot",
+                                                         daemon=True)
+                self._snapshot_writer.start()
+
+    def _write_snapshots(self):
+        while True:
+            with self._snapshot_lock:
+                state = self._snapshot_pending
+                if state is None:
+                    self._snapshot_writer = None
+                    return
+                wait = self._snapshot_due - time.monotonic()
+                if wait <= 0:
+                    self._snapshot_pending = None
+                else:
+                    self._snapshot_wake.clear()
+            if wait > 0:
+                self._snapshot_wake.wait(wait)
+                continue
+            manifest = self._manifest({path: entry[1:] for path, entry in state.files.items()})
+            self._save_snapshot(manifest, _SnapshotView(state))
+
+    def wait_for_snapshot(self, timeout=None):
+        """Write a pending snapshot rewrite now and block until it has finished (e.g. before exiting)."""
+        with self._snapshot_lock:
+            self._snapshot_due = 0.0
+            self._snapshot_wake.set()
+            writer = self._snapshot_writer
+        if writer is not None:
+            writer.join(timeout)
+
+    @timed("kb_refresh_seconds")
+    def refresh(self):
+        """Re-index only the files that were added, changed or removed since the last load.
+
+        Files whose size and mtime are unchanged are never read; a touched file whose
+        content hash still matches is not re-chunked. The new index generation is
+        swapped in with a single assignment, so searches already running keep using
+        the generation they started with. Returns a dict of the paths that changed.
+        """
+        with self._refresh_lock:
+            state = self._state
+            current = self._scan_files()
+            files = dict(state.files)
+            candidates = []
+            for path, stat in current.items():
+                entry = state.files.get(path)
+                if entry is None or entry[1:] != stat:
+                    candidates.append(path)
+            removed = [path for path in state.files if path not in current]
+
+            fresh_paths = []
+            for path in candidates:
+                entry = state.files.get(path)
+                if entry is not None:
+                    sha1 = self._file_sha1(path)
+                    if sha1 is None:
+                        removed.append(path)
+                        continue
+                    seg = state.segments[entry[0]]
+                    if seg.files[path][3] == sha1:
+                        # Touched, not edited: the spans still hold, under the new mtime
+                        if isinstance(seg.documents, ChunkSpans):
+                            seg.documents.restamp(path, current[path])
+                        files[path] = (entry[0],) + current[path]
+                        continue
+                fresh_paths.append(path)
+            fresh = self._read_files(fresh_paths)
+            fresh_paths = set(fresh_paths)
+
+            changes = {
+                "added": sorted(p for p in fresh_paths if p not in state.files),
+                "changed": sorted(p for p in fresh_paths if p in state.files),
+                "removed": sorted(removed),
+            }
+            if not fresh_paths and not removed:
+                if files != state.files:
+                    self._state = _IndexState(state.segments, state.dead, files, state.n_docs,
+                                              state.total_length, state.version, state.records)
+                    self._schedule_snapshot(self._state)
+                return changes
+
+            retire = []
+            for path in set(removed) | (fresh_paths & set(state.files)):
+                seg_idx = files.pop(path)[0]
+                retire.append((seg_idx, state.segments[seg_idx].files[path]))
+            segment = None
+            if fresh_paths:
+                segment = _Segment.build(fresh, self._build_encoder)
+                for path in segment.files:
+                    files[path] = (len(state.segments),) + current[path]
+            self._publish(state, retire, segment, files, dict(state.records))
+            self._schedule_snapshot(self._state)
+            return changes
+
+    def sync_records(self, collection, records):
+        """Index app records (memories, journal entries) of one collection as documents.
+
+        Each record is a dict with "id", "text" and optional "date" (YYYY-MM-DD)
+        and "category"; its chunks are returned by `search` with that metadata and
+        `source` set to `collection`. Only records added, edited or deleted since
+        the previous sync are (re-)indexed, so calling this after every save costs
+        work proportional to what changed. Returns a dict of changed record ids.
+        """
+        with self._refresh_lock:
+            state = self._state
+            prefix = f"{collection}:"
+            current = {prefix + str(record["id"]): record for record in records}
+            fingerprints = {key: self._record_fingerprint(record) for key, record in current.items()}
+
+            changes = {"added": [], "changed": [], "removed": []}
+            stale = []
+            for key, (_, fingerprint) in state.records.items():
+                if not key.startswith(prefix):
+                    continue
+                if key in current and fingerprints[key] == fingerprint:
+                    del current[key]
+                    continue
+                changes["changed" if key in current else "removed"].append(key[len(prefix):])
+                stale.append(key)
+            changes["added"] = [key[len(prefix):] for key in current if key not in state.records]
+            self._apply_records(state, collection, current, fingerprints, stale)
+            return changes
+
+    def update_records(self, collection, records=(), removed=()):
+        """Add or replace `records` and delete the `removed` ids of one collection.
+
+        Unlike sync_records, the collection's other records are left alone, so
+        the cost is proportional to the change rather than to the collection -
+        for callers that know what changed, such as an append-only log.
+        """
+        with self._refresh_lock:
+            state = self._state
+            prefix = f"{collection}:"
+            current = {prefix + str(record["id"]): record for record in records}
+            fingerprints = {key: self._record_fingerprint(record) for key, record in current.items()}
+            for key in list(current):
+                if state.records.get(key, (None, None))[1] == fingerprints[key]:
+                    del current[key]
+            stale = [key for key in current if key in state.records]
+            stale += [prefix + str(record_id) for record_id in removed
+                      if prefix + str(record_id) in state.records and prefix + str(record_id) not in current]
+            self._apply_records(state, collection, current, fingerprints, stale)
+
+    @staticmethod
+    def _record_fingerprint(record):
+        return hashlib.sha1(json.dumps(
+            [record.get("text"), record.get("date"), record.get("category")],
+            sort_keys=True, default=str,
+        ).encode("utf-8")).hexdigest()
+
+    def _apply_records(self, state, collection, fresh_records, fingerprints, stale):
+        """Retire the `stale` record keys and index `fresh_records` (key -> record). Callers hold `_refresh_lock`."""
+        if not stale and not fresh_records:
+            return
+        entries = dict(state.records)
+        retire = []
+        for key in stale:
+            seg_idx = entries.pop(key)[0]
+            retire.append((seg_idx, state.segments[seg_idx].records[key]))
+
+        fresh = []
+        for key, record in fresh_records.items():
+            docs = [
+                {
+                    "content": chunk,
+                    "source": collection,
+                    "date": record.get("date"),
+                    "category": record.get("category"),
+                    "record": key,
+                }
+                for chunk in self._split_text(record.get("text") or "", self.chunk_size, self.overlap)
+            ]
+            fresh.append((key, docs, fingerprints[key]))
+        segment = None
+        if fresh:
+            segment = _Segment.build_records(fresh, self._build_encoder)
+            for key, entry in segment.records.items():
+                entries[key] = (len(state.segments), entry[3])
+        self._publish(state, retire, segment, dict(state.files), entries)
+
+    def _publish(self, state, retire, segment, files, records):
+        """Swap in the next generation: retire entries and append `segment`.
+
+        `retire` lists (segment index, (start, end, tokens, fingerprint)) spans;
+        `files` and `records` must already point new entries at index
+        len(state.segments). Callers hold `_refresh_lock`.
+        """
+        segments = list(state.segments)
+        dead = list(state.dead)
+        n_docs, total_length = state.n_docs, state.total_length
+        retired = defaultdict(set)
+        for seg_idx, (start, end, length, _) in retire:
+            retired[seg_idx].update(range(start, end))
+            n_docs -= end - start
+            total_length -= length
+        for seg_idx, doc_ids in retired.items():
+            dead[seg_idx] = dead[seg_idx] | doc_ids
+
+        if segment is not None:
+            segments.append(segment)
+            dead.append(frozenset())
+            n_docs += len(segment.documents)
+            total_length += sum(segment.doc_lengths)
+
+        if len(segments) > self.max_segments:
+            segments, dead, files, records = self._merge_segments(segments, dead, files, records)
+
+        self._state = _IndexState(tuple(segments), tuple(dead), files, n_docs, total_length,
+                                  state.version + 1, records)
+
+    def _merge_segments(self, segments, dead, files, records):
+        """Merge the newest small segments of one kind (files or records) into one.
+
+        For each kind, the run starts at the newest segment and takes in older
+        ones only while they hold no more live chunks than the run so far, so
+        the cheaper run is merged and a large segment - the snapshot, or every
+        memory synced at startup - is left alone until the segments after it
+        add up to its size. Each chunk is merged O(log n) times instead of
+        the whole collection being re-indexed every `max_segments` updates.
+        """
+        kinds = defaultdict(list)
+        for seg_idx, seg in enumerate(segments):
+            if isinstance(seg, _Segment):  # the mmapped snapshot is never merged
+                kinds[seg.meta is not None].append(seg_idx)
+        best = None
+        for seg_ids in kinds.values():
+            if len(seg_ids) < 2:
+                continue
+            run, size = [], 0
+            for seg_idx in reversed(seg_ids):
+                live = len(segments[seg_idx].documents) - len(dead[seg_idx])
+                if len(run) >= 2 and live > size:
+                    break
+                run.append(seg_idx)
+                size += live
+            if best is None or size < best[0]:
+                best = (size, run)
+        if best is None:
+            return segments, dead, files, records
+
+        run = sorted(best[1])
+        parts = []
+        for seg_idx in run:
+            seg = segments[seg_idx]
+            vectors = seg.vectors if seg.vectors is not None else self._segment_vectors.get(seg)
+            paths = [path for path in seg.files if files.get(path, (None,))[0] == seg_idx]
+            keys = [key for key in seg.records if records.get(key, (None,))[0] == seg_idx]
+            parts.append((seg, paths, keys, vectors))
+        merged = _Segment.merge(parts, self._encoder.dim)
+
+        # Unmerged segments keep their order and the merged one goes last; only
+        # the entries of segments that moved are repointed
+        kept = [seg_idx for seg_idx in range(len(segments)) if seg_idx not in run]
+        moves = {seg_idx: i for i, seg_idx in enumerate(kept) if i != seg_idx}
+        moves.update((seg_idx, len(kept)) for seg_idx in run)
+        files, records = dict(files), dict(records)
+        for seg_idx, new_idx in moves.items():
+            seg = segments[seg_idx]
+            for entries, keys in ((files, seg.files), (records, seg.records)):
+                for key in keys:
+                    entry = entries.get(key)
+                    if entry is not None and entry[0] == seg_idx:
+                        entries[key] = (new_idx,) + entry[1:]
+        segments = [segments[seg_idx] for seg_idx in kept] + [merged]
+        dead = [dead[seg_idx] for seg_idx in kept] + [frozenset()]
+        return segments, dead, files, records
 
     def _split_text(self, text, chunk_size=500, overlap=50):
-        """Split text into overlapping chunks."""
-        if len(text) <= chunk_size:
-            return [text]
-
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            start = end - overlap
-        return chunks
-
-    def search(self, query, k=3):
-        """Search documents using simple keyword matching and scoring."""
-        if not self.documents:
+        """Split text into overlapping chunks on paragraph/sentence/word boundaries."""
+        return split_text(text, chunk_size=chunk_size, overlap=overlap)
+
+    def _bm25_scores(self, state, query, corpus_stats=None, allowed=None):
+        """Return {(seg_idx, doc_id): BM25 score} for every chunk matching a query term.
+
+        `corpus_stats` - (n_docs, total_length, {term: df}) - replaces this index's
+        own statistics, so shards of one corpus produce comparable scores.
+        `allowed` (see `_allowed_docs`) restricts which chunks are scored; document
+        frequencies still count the whole corpus.
+        """
+        k1, b = self.k1, self.b
+        n_docs, total_length = state.n_docs, state.total_length
+        if corpus_stats is not None:
+            n_docs, total_length, dfs = corpus_stats
+        avgdl = total_length / n_docs or 1.0
+        scores = defaultdict(float)
+        for term in set(_tokenize(query)):
+            hits = self._term_hits(state, term)
+            if not hits:
+                continue
+            df = len(hits) if corpus_stats is None else dfs[term]
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for seg_idx, doc_id, tf in hits:
+                if allowed is not None and allowed[seg_idx] is not None and doc_id not in allowed[seg_idx]:
+                    continue
+                length = state.segments[seg_idx].doc_lengths[doc_id]
+                scores[(seg_idx, doc_id)] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+        return scores
+
+    @staticmethod
+    def _term_hits(state, term):
+        """Live (seg_idx, doc_id, tf) postings for a term across all segments."""
+        hits = []
+        for seg_idx, seg in enumerate(state.segments):
+            postings = seg.postings.get(term)
+            if not postings:
+                continue
+            dead = state.dead[seg_idx]
+            hits.extend((seg_idx, doc_id, tf) for doc_id, tf in postings if doc_id not in dead)
+        return hits
+
+    @staticmethod
+    def _allowed_docs(state, filters):
+        """Per-segment sets of doc ids passing `filters` (None: no restriction)."""
+        if not filters:
+            return None
+        return [_filter_docs(seg, filters) for seg in state.segments]
+
+    @staticmethod
+    def _row_mask(dense, allowed):
+        """Boolean mask over dense rows for the docs in `allowed`."""
+        mask = np.zeros(len(dense.vectors), dtype=bool)
+        for seg_idx, doc_ids in enumerate(allowed):
+            row_of_doc = dense.row_of_doc[seg_idx]
+            if doc_ids is None:
+                mask[row_of_doc[row_of_doc >= 0]] = True
+            elif doc_ids:
+                rows = row_of_doc[np.fromiter(doc_ids, dtype=np.int64, count=len(doc_ids))]
+                mask[rows[rows >= 0]] = True
+        return mask
+
+    def corpus_stats(self, queries):
+        """Return (n_docs, total_length, {term: df}) for the terms of `queries`."""
+        state = self._state
+        terms = {term for query in queries for term in _tokenize(query)}
+        return state.n_docs, state.total_length, {term: len(self._term_hits(state, term)) for term in terms}
+
+    @staticmethod
+    def _top(scores, k):
+        """Top k ((seg_idx, doc_id), score) pairs; ties keep document order."""
+        top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0][0], -item[0][1]))
+        return [(key, score) for key, score in top if score > 0]
+
+    @property
+    def _build_encoder(self):
+        """Encoder for new segments to compute dense vectors with, if the mode uses them."""
+        return self._encoder if self.mode != "keyword" else None
+
+    def _dense_index(self, state):
+        """Quantized vectors for `state`, re-encoding only segments not seen before."""
+        dense = self._dense
+        if dense is not None and dense.state is state:
+            return dense
+
+        parts, seg_of_row, doc_of_row, row_of_doc = [], [], [], []
+        n_rows = 0
+        for seg_idx, seg in enumerate(state.segments):
+            live = np.ones(len(seg.documents), dtype=bool)
+            if state.dead[seg_idx]:
+                live[np.fromiter(state.dead[seg_idx], dtype=np.int64)] = False
+            rows = np.flatnonzero(live)
+            vectors = getattr(seg, "vectors", None)
+            if vectors is None:
+                vectors = self._segment_vectors.get(seg)
+            if vectors is None:
+                vectors = self._encode_live(seg, rows)
+                self._segment_vectors[seg] = vectors
+            parts.append((vectors, rows))
+            seg_of_row.append(np.full(len(rows), seg_idx, dtype=np.int32))
+            doc_of_row.append(rows)
+            row_of_doc.append(np.where(live, np.cumsum(live) - 1 + n_rows, -1))
+            n_rows += len(rows)
+
+        dense = _DenseIndex(
+            state,
+            QuantizedVectors.concatenate(parts, self._encoder.dim),
+            np.concatenate(seg_of_row) if seg_of_row else np.zeros(0, np.int32),
+            np.concatenate(doc_of_row) if doc_of_row else np.zeros(0, np.int64),
+            row_of_doc,
+        )
+        self._dense = dense
+        return dense
+
+    def _encode_live(self, seg, live_ids):
+        """Vectors of a segment built without an encoder; retired chunks, whose files may be gone, get zeros."""
+        documents = seg.documents
+        if isinstance(documents, ChunkSpans):
+            docs = documents.read(live_ids.tolist())
+        else:
+            docs = (documents[doc_id] for doc_id in live_ids.tolist())
+        vectors = np.zeros((len(documents), self._encoder.dim), dtype=np.float32)
+        if len(live_ids):
+            vectors[live_ids] = self._encoder.encode_many(_tokenize(doc["content"]) for doc in docs)
+        return QuantizedVectors.quantize(vectors)
+
+    def _dense_top(self, state, query, k, allowed=None):
+        dense = self._dense_index(state)
+        scores = dense.vectors.scores(self._encoder.encode_tokens(_tokenize(query)))
+        if allowed is not None:
+            scores[~self._row_mask(dense, allowed)] = 0
+        return self._top_rows(dense, scores, k)
+
+    def _hybrid_top(self, state, query, k, allowed=None):
+        """Fuse max-normalised BM25 (top candidates) with dense similarity (every chunk)."""
+        dense = self._dense_index(state)
+        dense_scores = np.maximum(dense.vectors.scores(self._encoder.encode_tokens(_tokenize(query))), 0)
+        if allowed is not None:
+            dense_scores[~self._row_mask(dense, allowed)] = 0
+        bm25 = self._bm25_scores(state, query, allowed=allowed)
+        candidates = self._top(bm25, self.hybrid_candidates)
+        fused = np.zeros(len(dense_scores), dtype=np.float32)
+        if candidates:
+            peak = candidates[0][1]
+            rows = [dense.row_of_doc[seg_idx][doc_id] for (seg_idx, doc_id), _ in candidates]
+            fused[rows] = [(1 - self.hybrid_weight) * score / peak for _, score in candidates]
+        fused += self.hybrid_weight * dense_scores
+        return self._top_rows(dense, fused, k)
+
+    @staticmethod
+    def _top_rows(dense, scores, k):
+        k = min(k, len(scores))
+        if k <= 0:
             return []
+        rows = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        rows = rows[np.lexsort((rows, -scores[rows]))]
+        rows = rows[scores[rows] > 0]
+        keys = zip(dense.seg_of_row[rows].tolist(), dense.doc_of_row[rows].tolist())
+        return list(zip(keys, scores[rows].tolist()))
+
+    def search(self, query, k=3, mode=None, filters=None):
+        """Search documents; `mode` overrides the instance's retrieval mode for this call.
+
+        `filters` restricts results by metadata, e.g. {"source": "memory",
+        "category": ["Family", "Travel"], "date_from": "2020-01-01",
+        "date_to": "2020-12-31"}; see `sync_records`.
+        """
+        return [doc for _, doc in self.search_scored(query, k, mode, filters=filters)]
+
+    def search_scored(self, query, k=3, mode=None, corpus_stats=None, filters=None):
+        """Like `search`, but return (score, doc) pairs, best first.
+
+        `corpus_stats` (see `corpus_stats()`) makes BM25 use statistics gathered
+        across several indexes, e.g. the shards of ShardedTextSearch. Filters are
+        applied inside the index, before ranking, so k results come back even
+        when most top-scoring chunks are filtered out.
+        """
+        def scored():
+            state = self._state
+            top = self._search_top(state, query, k, mode, corpus_stats, filters)
+            return [(score, state.segments[seg_idx].documents[doc_id]) for (seg_idx, doc_id), score in top]
+
+        return self._retry_stale(scored)
+
+    def _search_top(self, state, query, k, mode=None, corpus_stats=None, filters=None):
+        """Top k ((seg_idx, doc_id), score) pairs of `state`, best first."""
+        with timed(self.metrics_prefix + "search_seconds"):
+            mode = mode or self.mode
+            if mode not in self.MODES:
+                raise ValueError(f"Unknown search mode {mode!r}; expected one of {self.MODES}")
+            if not state.n_docs:
+                return []
+
+            allowed = self._allowed_docs(state, filters)
+            if mode == "keyword":
+                return self._top(self._bm25_scores(state, query, corpus_stats, allowed), k)
+            if mode == "dense":
+                return self._dense_top(state, query, k, allowed)
+            return self._hybrid_top(state, query, k, allowed)
+
+    def search_many(self, queries, k=3, filters=None):
+        """Search a batch of queries at once; returns one `search`-style result list per query.
+
+        The first call after a load or refresh flattens the index into a sparse
+        BM25 weight matrix; every batch after that is scored with vectorized
+        NumPy operations instead of a Python loop per query. Dense and hybrid
+        modes, and filtered searches, fall back to one `search` call per query.
+        """
+        if self.mode != "keyword" or filters:
+            return [self.search(query, k, filters=filters) for query in queries]
+
+        def batch():
+            state = self._state
+            if not state.n_docs:
+                return [[] for _ in queries]
+            matrix = self._matrix
+            if matrix is None or matrix.state is not state:
+                matrix = self._matrix = BM25Matrix(state, self.k1, self.b)
+            hits = matrix.top_k([_tokenize(query) for query in queries], k)
+            return [[state.segments[seg_idx].documents[doc_id] for seg_idx, doc_id in row] for row in hits]
+
+        return self._retry_stale(batch)
+
+    @property
+    def version(self):
+        """Corpus version; changes whenever a load or refresh changes the indexed content."""
+        return self._state.version
+
+    def get_context(self, query, k=3, filters=None, token_budget=None):
+        """Get formatted context string from search results.
+
+        Hits that are consecutive chunks of one file or record are merged
+        without their repeated overlap, and passages are packed best-first into
+        `token_budget` estimated tokens (default `context_token_budget`).
+
+        The ranked hits are cached per (query terms, k, mode, filters, corpus
+        version) and packed into the budget after the lookup, so a budget
+        that shrinks as a conversation grows still hits the cache.
+        Rephrasings with the same words hit it too (in dense and hybrid mode
+        only with the same word counts), and a refresh or record sync that
+        changes the corpus makes older entries unreachable.
+        """
+        budget = self.context_token_budget if token_budget is None else token_budget
+
+        def ranked_hits():
+            state = self._state
+            key = (_query_key(query, self.mode), k, self.mode, _freeze(filters), state.version)
+            hits = self._context_cache.get(key, _MISSING)
+            if hits is _MISSING:
+                hits = []
+                for (seg_idx, doc_id), _ in self._search_top(state, query, k, filters=filters):
+                    doc = state.segments[seg_idx].documents[doc_id]
+                    hits.append(((seg_idx, doc.get("record", doc["source"])), doc_id, doc["content"]))
+                hits = tuple(hits)
+                self._context_cache.put(key, hits)
+            return hits
+
+        hits = self._retry_stale(ranked_hits)
+        with timed(self.metrics_prefix + "context_pack_seconds"):
+            return pack_context(hits, budget, self.overlap)
 
-        query_words = set(query.lower().split())
-        scored_docs = []
-
-        for doc in self.documents:
-            content_lower = doc["content"].lower()
-            # Score based on how many query words appear in the document
-            score = 0
-            for word in query_words:
-                if word in content_lower:
-                    score += content_lower.count(word)
-
-            if score > 0:
-                scored_docs.append((score, doc))
-
-        # Sort by score descending and return top k
-        scored_docs.sort(key=lambda x: x[0], reverse=True)
-        return [doc for _, doc in scored_docs[:k]]
-
-    def get_context(self, query, k=3):
-        """Get formatted context string from search results."""
-        results = self.search(query, k)
-        if not results:
-            return ""
-        return "\n\n".join([doc["content"] for doc in results])
+    def cache_stats(self):
+        """Hit/miss/eviction counters and current size of the get_context hit cache."""
+        return self._context_cache.stats()